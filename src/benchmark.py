@@ -0,0 +1,292 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import quantile_sketch
+import shot_store
+import stats
+
+# Benchmark harness: synthetic MovieBench/hero-shaped data at configurable scale,
+# timings for every stats.get_*, plot_* and run_analysis.main, saved as JSON.
+
+# Log-normal shot lengths matching the bundled MovieBench corpus (median 3.0s, p95 ~9.6s)
+MB_LOG_MEDIAN = np.log(3.0)
+MB_LOG_SIGMA = 0.71
+
+# Titles the stats functions look for (genres, blockbusters, BPM comparisons),
+# mixed into the synthetic corpus so those code paths do real work
+KEYWORD_TITLES = [
+    "Harry Potter and the order of phoenix", "Indiana Jones and the last crusade", "Gran Torino",
+    "Identity Thief", "Vantage Point", "Quantum of Solace", "Spider-Man2", "Iron Man", "Skyfall",
+    "The Godfather", "This is 40", "Yes man", "Horrible Bosses", "Juno", "Forrest Gump",
+    "Benjamin Button", "Amadeus", "American Beauty", "The Dark Knight", "Superbad"
+]
+
+HERO_TITLES = [
+    "Mad Max: Fury Road", "The Bourne Ultimatum", "Moulin Rouge!", "Run Lola Run",
+    "Dune (2021)", "John Wick: Chapter 4", "Quantum of Solace"
+]
+
+def _movie_sizes(rng, n_shots, n_movies):
+    # Uneven but non-empty movie lengths that sum to n_shots
+    weights = rng.lognormal(0, 0.5, n_movies)
+    sizes = np.floor(weights / weights.sum() * (n_shots - n_movies)).astype(np.int64) + 1
+    sizes[:n_shots - sizes.sum()] += 1
+    return sizes
+
+def make_moviebench_frame(n_shots, n_movies, seed=0, compact=True):
+    """
+    MovieBench-shaped frame (movie_title, duration, clean_title) with log-normal
+    shot lengths at millisecond resolution. Titles are categorical and durations
+    int32 milliseconds, as load_data returns them; compact=False keeps durations
+    as float32 seconds (the layout before shot_store.compact_frame).
+    """
+    if n_shots < n_movies:
+        raise ValueError("Need at least one shot per movie")
+    rng = np.random.default_rng(seed)
+    sizes = _movie_sizes(rng, n_shots, n_movies)
+
+    names = [
+        f"{1000 + i}_{KEYWORD_TITLES[i].replace(' ', '_')}" if i < len(KEYWORD_TITLES) else f"{1000 + i}_Synthetic_Movie_{i}"
+        for i in range(n_movies)
+    ]
+    codes = np.repeat(np.arange(n_movies, dtype=np.int32), sizes)
+    durations = np.round(rng.lognormal(MB_LOG_MEDIAN, MB_LOG_SIGMA, n_shots), 3).astype(np.float32)
+
+    mb_df = pd.DataFrame({
+        "movie_title": pd.Categorical.from_codes(codes, categories=names),
+        "duration": durations
+    }, copy=False)
+    if compact:
+        mb_df = shot_store.compact_frame(mb_df)
+    mb_df['clean_title'] = stats.clean_title_column(mb_df['movie_title'])
+    return mb_df
+
+def make_hero_frame(n_shots, n_movies=len(HERO_TITLES), seed=1, compact=True):
+    """
+    Cinemetrics-shaped frame (movie_title, shot_number, start_time, shot_length_sec),
+    compact as load_data returns it. compact=False keeps MM:SS.s start timecodes
+    and float32 shot lengths, as the CSV holds them.
+    """
+    rng = np.random.default_rng(seed)
+    sizes = _movie_sizes(rng, n_shots, n_movies)
+    names = [HERO_TITLES[i] if i < len(HERO_TITLES) else f"Synthetic Hero {i}" for i in range(n_movies)]
+
+    codes = np.repeat(np.arange(n_movies, dtype=np.int32), sizes)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    shot_number = np.arange(n_shots) - np.repeat(starts, sizes) + 1
+    lengths = np.maximum(np.round(rng.lognormal(np.log(2.0), 0.7, n_shots), 1), 0.1)
+
+    # Cinemetrics timecodes are MM:SS.s of each shot's start
+    elapsed = pd.Series(lengths).groupby(codes).cumsum().to_numpy() - lengths
+    minutes = (elapsed // 60).astype(np.int64)
+    seconds = elapsed - minutes * 60
+    start_time = [f"{m:02d}:{s:04.1f}" for m, s in zip(minutes, seconds)]
+
+    hero_df = pd.DataFrame({
+        "movie_title": pd.Categorical.from_codes(codes, categories=names),
+        "shot_number": shot_number,
+        "start_time": start_time,
+        "shot_length_sec": lengths.astype(np.float32)
+    })
+    return shot_store.compact_frame(hero_df) if compact else hero_df
+
+def _time(fn, repeats):
+    # Best-of-N wall time; each repeat starts with a cold movie index
+    walls = []
+    for _ in range(repeats):
+        stats._INDEX_CACHE.clear()
+        start = time.perf_counter()
+        fn()
+        walls.append(time.perf_counter() - start)
+    return {"wall_s": min(walls), "repeats": walls}
+
+def bench_stats(mb_df, hero_df, repeats=3):
+    """Times each stats.get_* function on the given frames."""
+    sketch = quantile_sketch.sketch_from_values(shot_store.to_seconds(mb_df['duration']))
+    cases = {
+        "build_movie_index": lambda: stats.build_movie_index(mb_df),
+        "get_global_stats": lambda: stats.get_global_stats(mb_df),
+        "get_global_stats[sketch]": lambda: stats.get_global_stats(mb_df, sketch=sketch),
+        "get_reid_frequency": lambda: stats.get_reid_frequency(mb_df),
+        "get_wasteland_stat": lambda: stats.get_wasteland_stat(mb_df),
+        "get_editorial_bpm": lambda: stats.get_editorial_bpm(mb_df, hero_df),
+        "get_blockbuster_stats": lambda: stats.get_blockbuster_stats(mb_df, hero_df),
+        "get_bourne_data": lambda: stats.get_bourne_data(hero_df),
+        "get_heatmap_data": lambda: stats.get_heatmap_data(mb_df),
+        "get_genre_data": lambda: stats.get_genre_data(mb_df),
+        "get_genre_sketches": lambda: stats.get_genre_sketches(mb_df),
+        "build_pace_grid": lambda: stats.build_pace_grid(mb_df),
+        "get_cost_consistency_data": lambda: stats.get_cost_consistency_data(mb_df),
+    }
+    results = {}
+    for name, fn in cases.items():
+        results[name] = _time(fn, repeats)
+        print(f"  {name}: {results[name]['wall_s']:.4f}s")
+    return results
+
+def bench_plots(mb_df, hero_df, out_dir, repeats=1):
+    """Times each visualization.plot_* function, writing figures into out_dir."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import visualization
+
+    sketch = quantile_sketch.sketch_from_values(shot_store.to_seconds(mb_df['duration']))
+    path = lambda name: os.path.join(out_dir, f"{name}.png")
+    bourne = stats.get_bourne_data(hero_df)
+    blockbusters = stats.get_blockbuster_stats(mb_df, hero_df)
+    heatmap_df = stats.get_heatmap_data(mb_df)
+    pace = stats.build_pace_grid(mb_df)
+    genre_df = stats.get_genre_data(mb_df)
+    genre_sketches = stats.get_genre_sketches(mb_df)
+    cost_df = stats.get_cost_consistency_data(mb_df)
+
+    cases = {
+        "plot_barcode_timeline": lambda: visualization.plot_barcode_timeline(bourne, path("barcode")),
+        "plot_barcode_wall": lambda: visualization.plot_barcode_wall(hero_df, path("barcode_wall")),
+        "plot_cumulative_density": lambda: visualization.plot_cumulative_density(mb_df, path("cdf")),
+        "plot_cumulative_density[sketch]": lambda: visualization.plot_cumulative_density(mb_df, path("cdf_sketch"), sketch=sketch),
+        "plot_ceiling_scatter": lambda: visualization.plot_ceiling_scatter(blockbusters.copy(), path("scatter")),
+        "plot_heatmap_of_pace": lambda: visualization.plot_heatmap_of_pace(heatmap_df, path("heatmap")),
+        "plot_heatmap_of_pace[grid]": lambda: visualization.plot_heatmap_of_pace(None, path("heatmap_grid"), grid=pace),
+        "plot_genre_fingerprint": lambda: visualization.plot_genre_fingerprint(genre_df, path("genre")),
+        "plot_genre_fingerprint[sketch]": lambda: visualization.plot_genre_fingerprint(None, path("genre_sketch"), sketches=genre_sketches),
+        "plot_cost_of_consistency": lambda: visualization.plot_cost_of_consistency(cost_df, path("cost")),
+    }
+    results = {}
+    for name, fn in cases.items():
+        results[name] = _time(fn, repeats)
+        print(f"  {name}: {results[name]['wall_s']:.4f}s")
+    return results
+
+def bench_end_to_end(mb_df, hero_df, work_dir, workers=None):
+    """
+    Times run_analysis.main against CSVs of the synthetic data in work_dir:
+    a cold run (compiles the shot store, renders every figure), a warm run
+    (store and figures cached) and a warm chunked run (run_analysis --chunked).
+    """
+    import run_analysis
+
+    os.makedirs(os.path.join(work_dir, "data"), exist_ok=True)
+    mb_df[['movie_title', 'duration']].to_csv(os.path.join(work_dir, "data", "moviebench_raw.csv"), index=False)
+    hero_df.to_csv(os.path.join(work_dir, "data", "hero_movies_clean.csv"), index=False)
+
+    results = {}
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        for name, chunked in (("run_analysis.main[cold]", False), ("run_analysis.main[warm]", False),
+                              ("run_analysis.main[chunked]", True)):
+            stats._INDEX_CACHE.clear()
+            start = time.perf_counter()
+            run_analysis.main(workers=workers, chunked=chunked)
+            results[name] = {"wall_s": time.perf_counter() - start}
+            print(f"  {name}: {results[name]['wall_s']:.4f}s")
+    finally:
+        os.chdir(cwd)
+    return results
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare_results(previous, current, tolerance=1.2):
+    """Prints per-benchmark slowdown vs a previous run; returns names slower than tolerance x."""
+    regressions = []
+    for name, timing in current["timings"].items():
+        old = previous["timings"].get(name)
+        if not old or not old["wall_s"]:
+            continue
+        ratio = timing["wall_s"] / old["wall_s"]
+        flag = "  <-- REGRESSION" if ratio > tolerance else ""
+        print(f"  {name}: {old['wall_s']:.4f}s -> {timing['wall_s']:.4f}s ({ratio:.2f}x){flag}")
+        if ratio > tolerance:
+            regressions.append(name)
+    return regressions
+
+def run_benchmarks(n_shots, n_movies, hero_shots=5000, repeats=3, plots=True, end_to_end=True, workers=None, seed=0,
+                   float_seconds=False):
+    """
+    Runs the whole suite at one dataset size and returns the results dict.
+    The stats and plots run on the compact frames load_data returns; float_seconds
+    runs them on the older float32-seconds layout instead, for comparison.
+    """
+    print(f"Generating {n_shots} MovieBench shots across {n_movies} movies...")
+    # The end-to-end run reads CSVs, which hold seconds either way
+    csv_frames = (make_moviebench_frame(n_shots, n_movies, seed=seed, compact=False),
+                  make_hero_frame(hero_shots, seed=seed + 1, compact=False))
+    mb_df, hero_df = csv_frames
+    if not float_seconds:
+        mb_df = shot_store.compact_frame(mb_df)
+        hero_df = shot_store.compact_frame(hero_df)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "cpu_count": os.cpu_count(),
+            "n_shots": n_shots,
+            "n_movies": n_movies,
+            "hero_shots": hero_shots,
+            "seed": seed,
+            "compact": not float_seconds,
+            "frame_bytes": int(mb_df.memory_usage(deep=True).sum() + hero_df.memory_usage(deep=True).sum())
+        },
+        "timings": {}
+    }
+
+    print("Timing stats functions...")
+    results["timings"].update(bench_stats(mb_df, hero_df, repeats))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if plots:
+            print("Timing plot functions...")
+            results["timings"].update(bench_plots(mb_df, hero_df, tmp_dir))
+        if end_to_end:
+            print("Timing run_analysis.main...")
+            results["timings"].update(bench_end_to_end(*csv_frames, os.path.join(tmp_dir, "e2e"), workers))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the stats/visualization pipeline on synthetic shot data")
+    parser.add_argument("--shots", type=int, default=100_000, help="MovieBench-shaped shots to generate")
+    parser.add_argument("--movies", type=int, default=600, help="Movies to spread them across")
+    parser.add_argument("--hero-shots", type=int, default=5000, help="Cinemetrics-shaped shots to generate")
+    parser.add_argument("--repeats", type=int, default=3, help="Repeats per stats benchmark (best is reported)")
+    parser.add_argument("--no-plots", action="store_true", help="Skip plot_* timings")
+    parser.add_argument("--no-e2e", action="store_true", help="Skip the end-to-end run_analysis timing")
+    parser.add_argument("--workers", type=int, default=None, help="Render workers for the end-to-end run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--float-seconds", action="store_true",
+                        help="Benchmark on float32-second frames instead of the compact int32-millisecond ones")
+    parser.add_argument("--output", help="Results JSON (default: benchmarks/results-<shots>x<movies>.json)")
+    parser.add_argument("--compare", help="Previous results JSON to check for regressions")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.shots, args.movies, args.hero_shots, args.repeats,
+                             plots=not args.no_plots, end_to_end=not args.no_e2e,
+                             workers=args.workers, seed=args.seed, float_seconds=args.float_seconds)
+
+    output_path = args.output or os.path.join("benchmarks", f"results-{args.shots}x{args.movies}.json")
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {output_path}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            previous = json.load(f)
+        print(f"\nComparison against {args.compare}:")
+        if compare_results(previous, results):
+            raise SystemExit(1)
@@ -0,0 +1,214 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import pipeline_trace
+import quantile_sketch
+import scene_stats
+import sharded
+import shot_store
+import stats
+
+# Out-of-core execution of the report for corpora larger than RAM. Shots are read
+# in bounded batches (from the compiled store, or straight from the CSV) and every
+# stat and figure input is folded over them as a mergeable aggregate: per-movie
+# summaries with coverage and pace grid counts (the sharded partials), the duration
+# and per-genre sketches, and the scene stats. Only these aggregates, O(movies +
+# scenes + bins), outlive a batch, so peak memory is set by the batch size, which
+# is derived from a memory ceiling.
+#
+# Per-movie medians, rebuilt start times and scene spans need all of a film's shots
+# at once, so batches are cut at movie boundaries. Sources written movie by movie
+# (as fetch_moviebench writes them) stream in one pass; otherwise shots are first
+# spilled to scratch partitions by title hash, each holding complete movies.
+#
+# Batch sizes are set from the memory still free under the ceiling when each batch
+# is read, so batches shrink as the aggregates left behind grow.
+MB_CSV = "data/moviebench_raw.csv"
+MEMORY_MB = 2048
+# Peak working set per shot row while a batch is parsed, carried over and reduced
+# (CSV parsing and the movie index dominate), with headroom
+ROW_BYTES = 512
+MIN_BATCH_ROWS = 10_000
+READ_COLUMNS = ('movie_title', 'duration', 'start_time', 'scene_id')
+
+def check_memory_budget(memory_mb):
+    """Raises ValueError unless memory_mb leaves room above what this process already uses."""
+    if memory_mb <= 0:
+        raise ValueError(f"Memory ceiling must be positive, got {memory_mb} MB")
+    rss, _ = pipeline_trace.memory_mb()
+    if rss is not None and rss >= memory_mb:
+        raise ValueError(f"Memory ceiling of {memory_mb} MB is below the {rss:.0f} MB already in use")
+
+def batch_rows_for(memory_mb):
+    """Rows the next batch can hold under memory_mb, given what the process uses now."""
+    rss, _ = pipeline_trace.memory_mb()
+    return max(MIN_BATCH_ROWS, int((memory_mb - (rss or 0)) * 2**20 // ROW_BYTES))
+
+def _shot_frame(df):
+    # Source batch -> the columns the stats read, compact times and clean titles, as load_data returns them
+    df = shot_store.compact_frame(df[[col for col in READ_COLUMNS if col in df]])
+    df['clean_title'] = stats.clean_title_column(df['movie_title'])
+    return df.drop(columns='movie_title')
+
+def iter_csv_batches(csv_path, next_rows):
+    """Yields the shots of a MovieBench CSV in frames of next_rows() rows (fewer at the end)."""
+    header = pd.read_csv(csv_path, nrows=0).columns
+    usecols = [col for col in READ_COLUMNS if col in header]
+    with pd.read_csv(csv_path, usecols=usecols, chunksize=MIN_BATCH_ROWS) as reader:
+        while True:
+            try:
+                chunk = reader.get_chunk(next_rows())
+            except StopIteration:
+                return
+            yield _shot_frame(chunk)
+
+def iter_store_batches(store_path, next_rows):
+    """Yields the shots of a compiled MovieBench store in frames of next_rows() rows (fewer at the end)."""
+    n_rows = shot_store.store_rows(store_path)
+    start = 0
+    while start < n_rows:
+        stop = min(start + next_rows(), n_rows)
+        yield _shot_frame(shot_store.read_store_rows(store_path, start, stop, READ_COLUMNS))
+        start = stop
+
+def _estimate_csv_rows(csv_path, sample_bytes=1 << 16):
+    with open(csv_path, 'rb') as f:
+        sample = f.read(sample_bytes)
+    return int(os.path.getsize(csv_path) / (len(sample) / max(sample.count(b'\n'), 1)))
+
+def movie_batches(batches, state):
+    """
+    Re-cuts shot batches at movie boundaries, yielding frames of complete movies
+    (a movie longer than a batch is carried over until it ends). Each movie's
+    shots must be contiguous in the source: when a finished movie shows up again,
+    state['grouped'] is set to False and the generator stops.
+    """
+    finished = set()
+    carry = None
+    for batch in batches:
+        frame = batch if carry is None else pd.concat([carry, batch], ignore_index=True)
+        titles = np.asarray(frame['clean_title'], dtype=object)
+        titled = np.flatnonzero(pd.notna(titles))
+        if len(titled) == 0:
+            carry = frame
+            continue
+
+        keys = titles[titled]
+        run_starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        run_titles = keys[run_starts]
+        if len(set(run_titles)) < len(run_titles) or not finished.isdisjoint(run_titles):
+            state['grouped'] = False
+            return
+
+        # Everything before the last movie's first shot is complete
+        cut = titled[run_starts[-1]]
+        finished.update(run_titles[:-1])
+        if cut:
+            yield frame.iloc[:cut]
+        carry = frame.iloc[cut:]
+
+    if carry is not None and len(carry):
+        yield carry
+
+def partition_batches(batches, n_partitions, scratch_dir):
+    """
+    Spills shot batches to n_partitions scratch stores by title hash, then yields
+    each partition as one frame. Every movie lands whole in one partition, its
+    shots in source order.
+    """
+    for i, batch in enumerate(batches):
+        partition = pd.util.hash_array(np.asarray(batch['clean_title'], dtype=object)) % n_partitions
+        for p in np.unique(partition):
+            shot_store.append_frames(os.path.join(scratch_dir, str(p)), [(f"{i:08d}", "0", batch[partition == p])])
+    for p in range(n_partitions):
+        partition_path = os.path.join(scratch_dir, str(p))
+        if os.path.exists(partition_path):
+            yield shot_store.open_segments(partition_path)
+
+def new_aggregates(thresholds, fold_sketch=True):
+    """Creates the empty aggregates add_batch folds into."""
+    return {
+        "thresholds": thresholds,
+        "partials": [],
+        "sketch": quantile_sketch.new_sketch() if fold_sketch else None,
+        "genre_sketches": {},
+        "scenes": [],
+        "rows": 0,
+        "batches": 0
+    }
+
+def add_batch(agg, df):
+    """Folds a frame of complete movies into agg in place."""
+    agg['partials'].append(sharded.frame_partials(df, agg['thresholds']))
+    if agg['sketch'] is not None:
+        quantile_sketch.update_sketch(agg['sketch'], shot_store.to_seconds(df['duration']))
+    for genre, sketch in stats.get_genre_sketches(df).items():
+        current = agg['genre_sketches'].get(genre)
+        agg['genre_sketches'][genre] = sketch if current is None else quantile_sketch.merge_sketches(current, sketch)
+    scenes = stats.get_scene_stats(df)
+    if scenes is not None:
+        agg['scenes'].append(scenes)
+    agg['rows'] += len(df)
+    agg['batches'] += 1
+    return agg
+
+def get_chunked_stats(hero_df, csv_path=MB_CSV, memory_mb=MEMORY_MB, store_dir=shot_store.STORE_DIR):
+    """
+    Chunked equivalent of the stats run_analysis prints, plus the figure inputs
+    ('coverage', 'pace_grid', 'sketch', 'genre_sketches', 'scene_stats'), computed
+    in batches sized to stay under memory_mb. Reads the compiled store of csv_path
+    when it is fresh and the CSV itself otherwise, since compiling loads it whole.
+    Returns None when there are no shots.
+    """
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(csv_path)
+    check_memory_budget(memory_mb)
+    next_rows = lambda: batch_rows_for(memory_mb)
+    thresholds = np.linspace(0, 60, 120)
+
+    store_path = shot_store.store_path_for(csv_path, store_dir)
+    if shot_store.is_fresh(csv_path, store_path):
+        # The store's ingest-time sketch is the one the in-memory run reports from
+        source = "store"
+        read = lambda: iter_store_batches(store_path, next_rows)
+        sketch = shot_store.store_sketch(store_path, 'duration')
+        n_rows = shot_store.store_rows(store_path)
+    else:
+        source = "CSV"
+        read = lambda: iter_csv_batches(csv_path, next_rows)
+        sketch = None
+        n_rows = _estimate_csv_rows(csv_path)
+
+    agg = new_aggregates(thresholds, fold_sketch=sketch is None)
+    state = {"grouped": True}
+    for df in movie_batches(read(), state):
+        add_batch(agg, df)
+
+    if not state["grouped"]:
+        print("Shots are not grouped by movie; partitioning them by title first...")
+        agg = new_aggregates(thresholds, fold_sketch=sketch is None)
+        # Scratch lives next to the store rather than in /tmp, which may be RAM-backed
+        os.makedirs(store_dir, exist_ok=True)
+        scratch_dir = tempfile.mkdtemp(prefix="chunks-", dir=store_dir)
+        try:
+            for df in partition_batches(read(), max(1, -(-n_rows // next_rows())), scratch_dir):
+                add_batch(agg, df)
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    print(f"Folded {agg['rows']} shots from the {source} in {agg['batches']} batches under {memory_mb} MB")
+    if agg['rows'] == 0:
+        return None
+
+    if sketch is None:
+        sketch = agg['sketch']
+    merged = sharded.merge_partials(agg['partials'])
+    results = stats.stats_from_partials(merged, pd.DataFrame(), hero_df, thresholds, sketch=sketch)
+    results["sketch"] = sketch
+    # In the order get_genre_sketches returns them, whatever order batches met them in
+    results["genre_sketches"] = {genre: agg['genre_sketches'][genre]
+                                 for genre in stats.DEFAULT_GENRE_MAP if genre in agg['genre_sketches']}
+    results["scene_stats"] = scene_stats.merge_scene_stats(*agg['scenes']) if agg['scenes'] else None
+    return results
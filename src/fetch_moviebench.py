@@ -1,69 +1,418 @@
 import json
+import numpy as np
 import pandas as pd
 import os
+import argparse
 from huggingface_hub import hf_hub_download
-import re
-
-def parse_timestamp(ts_str):
-    # Format: HH.MM.SS.mmm
-    try:
-        parts = ts_str.split('.')
-        hours = int(parts[0])
-        minutes = int(parts[1])
-        seconds = int(parts[2])
-        milliseconds = int(parts[3])
+import quantile_sketch
+import pace_grid
+import scene_stats
+
+# Shot strings end in a fixed-width suffix: _HH.MM.SS.mmm-HH.MM.SS.mmm
+TS_SUFFIX_LEN = 26
+_TS_SEPARATORS = {0: '_', 3: '.', 6: '.', 9: '.', 13: '-', 16: '.', 19: '.', 22: '.'}
+_TS_DIGITS = [i for i in range(TS_SUFFIX_LEN) if i not in _TS_SEPARATORS]
+
+def _suffix_number(codes, lo, width):
+    # Builds an integer column from `width` digit characters starting at `lo`
+    value = np.zeros(len(codes), dtype=np.int64)
+    for i in range(lo, lo + width):
+        value = value * 10 + (codes[:, i].astype(np.int64) - ord('0'))
+    return value
+
+def _suffix_millis(codes, lo):
+    hours = _suffix_number(codes, lo, 2)
+    minutes = _suffix_number(codes, lo + 3, 2)
+    seconds = _suffix_number(codes, lo + 6, 2)
+    milliseconds = _suffix_number(codes, lo + 9, 3)
+    return ((hours * 60 + minutes) * 60 + seconds) * 1000 + milliseconds
+
+def extract_timestamps(shot_strings):
+    """
+    Decodes the trailing HH.MM.SS.mmm start/end timestamps of every shot string in
+    one NumPy pass.
+    Returns (start_sec, end_sec, duration, malformed): float arrays that are NaN
+    wherever the string does not end in a valid timestamp pair, and the boolean
+    mask of those malformed rows.
+    """
+    tails = np.array([s[-TS_SUFFIX_LEN:] for s in shot_strings], dtype=f'U{TS_SUFFIX_LEN}')
+    # Shorter strings are NUL-padded, so they fail the digit check below
+    codes = tails.view(np.uint32).reshape(len(tails), TS_SUFFIX_LEN)
+    
+    sep_cols = list(_TS_SEPARATORS)
+    sep_codes = np.array([ord(_TS_SEPARATORS[i]) for i in sep_cols], dtype=np.uint32)
+    valid = (codes[:, sep_cols] == sep_codes).all(axis=1)
+    valid &= ((codes[:, _TS_DIGITS] - ord('0')) <= 9).all(axis=1)
+    
+    start_ms = _suffix_millis(codes, 1)
+    end_ms = _suffix_millis(codes, 14)
+    # Differenced in whole milliseconds, so durations carry no float noise (5.787, not 5.787000000000001)
+    start_sec = np.where(valid, start_ms / 1000.0, np.nan)
+    end_sec = np.where(valid, end_ms / 1000.0, np.nan)
+    duration = np.where(valid, (end_ms - start_ms) / 1000.0, np.nan)
+    return start_sec, end_sec, duration, ~valid
+
+# Columns of the extracted shot CSV; times are in seconds on the film's own timeline
+SHOT_COLUMNS = ["movie_title", "scene_id", "start_time", "end_time", "duration"]
+
+def collect_scene_shots(scenes_dict):
+    """Flattens one movie's scene dict into aligned lists of scene keys and shot strings."""
+    scene_ids = []
+    shot_strings = []
+    if not isinstance(scenes_dict, dict):
+        return scene_ids, shot_strings
+    for scene_id, shot_list in scenes_dict.items():
+        if isinstance(shot_list, list):
+            shots = [shot_str for shot_str in shot_list if isinstance(shot_str, str)]
+            scene_ids.extend([scene_id] * len(shots))
+            shot_strings.extend(shots)
+    return scene_ids, shot_strings
+
+def shots_frame(titles, scene_ids, shot_strings):
+    """
+    Decodes shot strings into a SHOT_COLUMNS frame. Returns (df, n_malformed);
+    shots whose end does not follow their start are dropped, as before.
+    """
+    start_sec, end_sec, duration, malformed = extract_timestamps(shot_strings)
+    keep = ~malformed & (duration > 0)
+    df = pd.DataFrame({
+        "movie_title": titles,
+        "scene_id": scene_ids,
+        "start_time": start_sec,
+        "end_time": end_sec,
+        "duration": duration
+    }, columns=SHOT_COLUMNS)[keep]
+    return df, int(malformed.sum())
+
+def get_scenes_path(input_path=None):
+    """Returns a local movies_scenes.json, downloading it from the Hub if needed."""
+    if input_path:
+        return input_path
+    return hf_hub_download(repo_id="weijiawu/MovieBench", filename="movies_scenes.json", repo_type="dataset")
+
+def extract_movie_shots(movie_id, scenes_dict):
+    """Returns (shots_df, n_malformed) for one movie's scene dict (see shots_frame)."""
+    scene_ids, shot_strings = collect_scene_shots(scenes_dict)
+    return shots_frame([movie_id] * len(shot_strings), scene_ids, shot_strings) # Using ID as title for now
+
+def _skip_ws(buf, pos):
+    while pos < len(buf) and buf[pos] in ' \t\r\n':
+        pos += 1
+    return pos
+
+def iter_movies(file_path, read_size=1 << 20):
+    """
+    Yields (movie_id, scenes_dict) pairs from movies_scenes.json one movie at a time.
+    Only the current movie's subtree is decoded, so memory stays flat however large
+    the top-level object is.
+    """
+    decoder = json.JSONDecoder()
+    
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buf = ''
+        pos = 0
+        eof = False
+        
+        def next_token(expected=None):
+            # Returns the next non-whitespace character, refilling the buffer as needed
+            nonlocal buf, pos, eof
+            while True:
+                pos = _skip_ws(buf, pos)
+                if pos < len(buf):
+                    ch = buf[pos]
+                    if expected and ch not in expected:
+                        raise ValueError(f"Malformed movies_scenes.json: expected {expected!r} at offset {pos}, got {ch!r}")
+                    return ch
+                if eof:
+                    raise ValueError("Malformed movies_scenes.json: unexpected end of file")
+                chunk = f.read(read_size)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
         
-        return hours * 3600 + minutes * 60 + seconds + milliseconds / 1000.0
-    except:
-        return 0
+        def next_value():
+            # Decodes one JSON value, reading more input until it is complete
+            nonlocal buf, pos, eof
+            need = read_size
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                    pos = end
+                    return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    # Grow geometrically so one huge movie is not re-decoded chunk by chunk
+                    chunk = f.read(need)
+                    eof = not chunk
+                    buf = buf[pos:] + chunk
+                    pos = 0
+                    need *= 2
+        
+        next_token('{')
+        pos += 1
+        if next_token() == '}':
+            return
+        
+        while True:
+            next_token('"')
+            movie_id = next_value()
+            next_token(':')
+            pos += 1
+            next_token()
+            scenes_dict = next_value()
+            yield movie_id, scenes_dict
+            
+            # Drop the consumed prefix so the buffer never holds more than one movie
+            buf = buf[pos:]
+            pos = 0
+            
+            if next_token(',}') == '}':
+                return
+            pos += 1
+
+def _input_signature(file_path):
+    # Identifies the input a checkpoint was written from (the scenes JSON is too big to hash on every run)
+    st = os.stat(file_path)
+    return {"input": os.path.abspath(file_path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def _load_checkpoint(checkpoint_path, source):
+    """
+    Returns (done_movie_ids, committed_offset, committed_shots) from a streaming
+    checkpoint. A checkpoint whose first line does not record source (see
+    _input_signature) was written from another input and counts as empty.
+    """
+    done = set()
+    offset = 0
+    shots = 0
+    if not os.path.exists(checkpoint_path):
+        return done, offset, shots
+    
+    with open(checkpoint_path, 'r') as f:
+        try:
+            header = json.loads(f.readline())
+        except json.JSONDecodeError:
+            header = None
+        if not isinstance(header, dict) or header.get("source") != source:
+            print(f"Checkpoint {checkpoint_path} is for a different input; starting over")
+            return done, offset, shots
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn final line means that chunk never committed
+                break
+            done.update(entry['movies'])
+            offset = entry['offset']
+            shots = entry.get('shots', 0)
+    return done, offset, shots
+
+def sketch_path_for(output_path):
+    """Where the ingest-time duration sketch for output_path is kept."""
+    return output_path + ".sketch.npz"
+
+def _resume_sketch(output_path, committed_shots):
+    # The sketch is saved after the checkpoint line, so a crash in between leaves it
+    # one chunk behind; rebuild it from the committed rows in that case
+    sketch_path = sketch_path_for(output_path)
+    if os.path.exists(sketch_path):
+        sketch = quantile_sketch.load_sketch(sketch_path)
+        if sketch['count'] == committed_shots:
+            return sketch
+    
+    sketch = quantile_sketch.new_sketch()
+    for chunk_df in pd.read_csv(output_path, usecols=['duration'], chunksize=1_000_000):
+        quantile_sketch.update_sketch(sketch, chunk_df['duration'].to_numpy())
+    return sketch
 
-def parse_mb_structure():
+def pace_grid_path_for(output_path):
+    """Where the ingest-time pace grid for output_path is kept."""
+    return output_path + ".pace_grid.npz"
+
+def scene_stats_path_for(output_path):
+    """Where the ingest-time scene aggregates for output_path are kept."""
+    return output_path + ".scenes.npz"
+
+def _iter_output_movies(output_path, chunksize=1_000_000):
+    # Re-reads the written CSV in chunks of whole movies. Movies are written
+    # contiguously, so the last title of each chunk is carried into the next one.
+    carry = None
+    for chunk_df in pd.read_csv(output_path, chunksize=chunksize, dtype={'movie_title': str, 'scene_id': str}):
+        if carry is not None:
+            chunk_df = pd.concat([carry, chunk_df], ignore_index=True)
+        last = chunk_df['movie_title'].iloc[-1]
+        carry = chunk_df[chunk_df['movie_title'] == last]
+        yield chunk_df[chunk_df['movie_title'] != last]
+    if carry is not None:
+        yield carry
+
+def _add_chunk(grid, scenes, chunk_df):
+    # Folds a chunk of whole movies into the pace grid and scene aggregates
+    for _, movie_df in chunk_df.groupby('movie_title', sort=False):
+        pace_grid.add_movie(grid, movie_df['duration'].to_numpy(), movie_df['start_time'].to_numpy())
+    scene_stats.add_shots(scenes, chunk_df['movie_title'].to_numpy(), chunk_df['scene_id'].to_numpy(),
+                          chunk_df['start_time'].to_numpy(), chunk_df['duration'].to_numpy())
+
+def _resume_aggregates(output_path, committed_shots):
+    # Same recovery as the sketch, for the pace grid and scene aggregates together
+    grid_path = pace_grid_path_for(output_path)
+    scenes_path = scene_stats_path_for(output_path)
+    if os.path.exists(grid_path) and os.path.exists(scenes_path):
+        grid = pace_grid.load_pace_grid(grid_path)
+        scenes = scene_stats.load_scene_stats(scenes_path)
+        if grid['n_shots'] == committed_shots and scenes['n_shots'] == committed_shots:
+            return grid, scenes
+    
+    grid = pace_grid.new_pace_grid()
+    scenes = scene_stats.new_scene_stats()
+    for movies_df in _iter_output_movies(output_path):
+        _add_chunk(grid, scenes, movies_df)
+    return grid, scenes
+
+def parse_mb_structure_streaming(input_path=None, output_path="analysis/data/moviebench_shots.csv",
+                                 chunk_rows=50000, checkpoint_path=None):
+    """
+    Streaming variant of parse_mb_structure.
+    Walks movies one at a time and appends shot rows to output_path in columnar chunks
+    of roughly chunk_rows. After each chunk the movie IDs it contains are committed to
+    a checkpoint, so an interrupted run resumes where it left off.
+    A mergeable duration sketch, the Heatmap of Pace grid and the scene-level
+    aggregates (see scene_stats) are updated in the same pass as movies arrive and
+    saved next to the output.
+    """
+    file_path = get_scenes_path(input_path)
+    checkpoint_path = checkpoint_path or output_path + ".checkpoint"
+    source = _input_signature(file_path)
+    
+    done, offset, committed_shots = _load_checkpoint(checkpoint_path, source)
+    if done and os.path.exists(output_path):
+        # Discard any rows written after the last committed chunk
+        with open(output_path, 'r+b') as out:
+            out.truncate(offset)
+        sketch = _resume_sketch(output_path, committed_shots)
+        grid, scenes = _resume_aggregates(output_path, committed_shots)
+        print(f"Resuming: {len(done)} movies already written to {output_path}")
+    else:
+        done = set()
+        committed_shots = 0
+        sketch = quantile_sketch.new_sketch()
+        grid = pace_grid.new_pace_grid()
+        scenes = scene_stats.new_scene_stats()
+        for stale in (output_path, checkpoint_path, sketch_path_for(output_path), pace_grid_path_for(output_path),
+                      scene_stats_path_for(output_path)):
+            if os.path.exists(stale):
+                os.remove(stale)
+    
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    if not done:
+        with open(checkpoint_path, 'w') as ckpt:
+            ckpt.write(json.dumps({"source": source}) + "\n")
+    
+    movie_frames = []
+    pending_movies = []
+    buffered = 0
+    total = 0
+    malformed = 0
+    max_duration = 0.0
+    
+    def flush():
+        nonlocal movie_frames, pending_movies, buffered, committed_shots
+        if pending_movies:
+            write_header = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+            chunk_df = pd.concat(movie_frames, ignore_index=True)
+            # Chunks with no valid shots are only checkpointed, so no header-only file appears
+            if len(chunk_df):
+                chunk_df.to_csv(output_path, mode='a', header=write_header, index=False)
+            
+            committed_shots += len(chunk_df)
+            with open(checkpoint_path, 'a') as ckpt:
+                ckpt.write(json.dumps({
+                    "offset": os.path.getsize(output_path) if os.path.exists(output_path) else 0,
+                    "shots": committed_shots,
+                    "movies": pending_movies
+                }) + "\n")
+            
+            quantile_sketch.update_sketch(sketch, chunk_df['duration'].to_numpy())
+            quantile_sketch.save_sketch(sketch, sketch_path_for(output_path))
+            _add_chunk(grid, scenes, chunk_df)
+            pace_grid.save_pace_grid(grid, pace_grid_path_for(output_path))
+            scene_stats.save_scene_stats(scenes, scene_stats_path_for(output_path))
+        movie_frames, pending_movies = [], []
+        buffered = 0
+    
+    print(f"Streaming {file_path}...")
+    for movie_id, scenes_dict in iter_movies(file_path):
+        if movie_id in done:
+            continue
+        
+        movie_df, movie_malformed = extract_movie_shots(movie_id, scenes_dict)
+        movie_frames.append(movie_df)
+        pending_movies.append(movie_id)
+        
+        buffered += len(movie_df)
+        total += len(movie_df)
+        malformed += movie_malformed
+        if len(movie_df):
+            max_duration = max(max_duration, movie_df['duration'].max())
+        
+        if buffered >= chunk_rows:
+            flush()
+    flush()
+    
+    print(f"Extracted {total} new shots.")
+    if malformed:
+        print(f"Skipped {malformed} shots with malformed timestamps.")
+    if total > 0:
+        print(f"Max Shot Length: {max_duration:.2f}s")
+    if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        print(f"Saved to {output_path}")
+
+def parse_mb_structure(input_path=None, output_path="analysis/data/moviebench_shots.csv"):
     print("Loading cached movies_scenes.json...")
-    file_path = hf_hub_download(repo_id="weijiawu/MovieBench", filename="movies_scenes.json", repo_type="dataset")
+    file_path = get_scenes_path(input_path)
     
     with open(file_path, 'r') as f:
         data = json.load(f)
         
-    all_shots = []
-    
-    # Regex to capture timestamps at the end of the string
-    # Pattern: _(HH.MM.SS.mmm)-(HH.MM.SS.mmm)$
-    re_ts = re.compile(r'_(\d{2}\.\d{2}\.\d{2}\.\d{3})-(\d{2}\.\d{2}\.\d{2}\.\d{3})$')
+    titles = []
+    scene_ids = []
+    shot_strings = []
     
     for movie_id, scenes_dict in data.items():
-        for scene_desc, shot_list in scenes_dict.items():
-            if not isinstance(shot_list, list):
-                continue
-                
-            for shot_str in shot_list:
-                if not isinstance(shot_str, str):
-                    continue
-                    
-                match = re_ts.search(shot_str)
-                if match:
-                    start_str = match.group(1)
-                    end_str = match.group(2)
-                    
-                    start_sec = parse_timestamp(start_str)
-                    end_sec = parse_timestamp(end_str)
-                    
-                    if end_sec > start_sec:
-                        duration = end_sec - start_sec
-                        all_shots.append({
-                            "movie_title": movie_id, # Using ID as title for now
-                            "duration": duration
-                        })
-
-    print(f"Extracted {len(all_shots)} shots.")
-    
-    if len(all_shots) > 0:
-        df = pd.DataFrame(all_shots)
+        movie_scene_ids, movie_shots = collect_scene_shots(scenes_dict)
+        titles.extend([movie_id] * len(movie_shots)) # Using ID as title for now
+        scene_ids.extend(movie_scene_ids)
+        shot_strings.extend(movie_shots)
+    
+    # Decode the whole dataset's timestamps in one batch
+    df, malformed = shots_frame(titles, scene_ids, shot_strings)
+
+    print(f"Extracted {len(df)} shots.")
+    if malformed:
+        print(f"Skipped {malformed} shots with malformed timestamps.")
+    
+    if len(df) > 0:
         print(f"Median Shot Length: {df['duration'].median():.2f}s")
         print(f"Max Shot Length: {df['duration'].max():.2f}s")
         
-        output_path = "analysis/data/moviebench_shots.csv"
         df.to_csv(output_path, index=False)
+        quantile_sketch.save_sketch(quantile_sketch.sketch_from_values(df['duration']), sketch_path_for(output_path))
+        grid = pace_grid.new_pace_grid()
+        scenes = scene_stats.new_scene_stats()
+        _add_chunk(grid, scenes, df)
+        pace_grid.save_pace_grid(grid, pace_grid_path_for(output_path))
+        scene_stats.save_scene_stats(scenes, scene_stats_path_for(output_path))
         print(f"Saved to {output_path}")
 
 if __name__ == "__main__":
-    parse_mb_structure()
+    parser = argparse.ArgumentParser(description="Extract shots (scene, start/end time, duration) from MovieBench movies_scenes.json")
+    parser.add_argument("--input", help="Local movies_scenes.json (defaults to the Hugging Face copy)")
+    parser.add_argument("--output", default="analysis/data/moviebench_shots.csv")
+    parser.add_argument("--stream", action="store_true", help="Walk movies one at a time with flat memory and resume support")
+    parser.add_argument("--chunk-rows", type=int, default=50000, help="Rows per write in --stream mode")
+    args = parser.parse_args()
+    
+    if args.stream:
+        parse_mb_structure_streaming(args.input, args.output, chunk_rows=args.chunk_rows)
+    else:
+        parse_mb_structure(args.input, args.output)
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+import pace_grid
+import shot_store
+import stats
+
+# Incremental recompute of the headline stats. Every movie's shots are hashed, and
+# its partial aggregates (shot count, duration sum, sorted durations, wasteland and
+# coverage bin counts, pace grid bins) are cached under that hash. A run only
+# aggregates movies whose hash is new, then merges all partials the same way the
+# sharded path does, so the results match the serial run exactly.
+CACHE_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+def _config_digest(thresholds, dtype):
+    # Anything that changes what a partial holds must change every movie's hash
+    grid = pace_grid.new_pace_grid()
+    digest = hashlib.sha256(f"v{CACHE_VERSION}:{np.dtype(dtype).str}".encode())
+    for values in (thresholds, grid['x_edges'], grid['y_edges']):
+        digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    return digest.digest()
+
+def group_movies(df, title_col='clean_title', duration_col='duration', start_col='start_time'):
+    """
+    Groups shots by movie without the per-movie sorting of stats.build_movie_index.
+    Returns (titles, offsets, grouped_durations, grouped_starts) with movie i's
+    shots, in their original order and dtype, at [offsets[i]:offsets[i + 1]].
+    grouped_starts is None when df has no start_col.
+    """
+    codes, uniques = pd.factorize(df[title_col], sort=True)
+    rows = np.flatnonzero(codes >= 0)
+    order = rows[np.argsort(codes[rows], kind='stable')]
+    offsets = np.zeros(len(uniques) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes[rows], minlength=len(uniques)), out=offsets[1:])
+    starts = df[start_col].to_numpy()[order] if start_col in df else None
+    return np.asarray(uniques, dtype=object), offsets, df[duration_col].to_numpy()[order], starts
+
+def movie_hashes(offsets, grouped, thresholds, grouped_starts=None):
+    """Content hash of each movie's durations and start times (plus the partial layout)."""
+    config = _config_digest(thresholds, grouped.dtype)
+    hashes = []
+    for i in range(len(offsets) - 1):
+        digest = hashlib.sha256(config + grouped[offsets[i]:offsets[i + 1]].tobytes())
+        if grouped_starts is not None:
+            digest.update(b"starts" + grouped_starts[offsets[i]:offsets[i + 1]].tobytes())
+        hashes.append(digest.hexdigest())
+    return hashes
+
+def movie_partial(durations, thresholds, start_times=None):
+    """
+    Reduces one movie's shot durations (in order, either time representation) to
+    its cacheable partial aggregates. 'sorted' keeps the stored representation.
+    """
+    as_float = shot_store.to_seconds(durations)
+    starts = None if start_times is None else shot_store.to_seconds(start_times)
+    counts = pace_grid.add_movie(pace_grid.new_pace_grid(), as_float, starts)['counts'].ravel()
+    pace_bins = np.flatnonzero(counts)
+    return {
+        "count": len(as_float),
+        # reduceat sums exactly as stats.build_movie_index does for the same shots
+        "total": np.add.reduceat(as_float, [0])[0],
+        "sorted": np.sort(durations),
+        "wasteland": int(stats.in_wasteland(as_float).sum()),
+        "coverage_counts": stats.coverage_bin_counts(as_float, thresholds),
+        "pace_bins": pace_bins,
+        "pace_counts": counts[pace_bins]
+    }
+
+def _load_partial(path):
+    with np.load(path, allow_pickle=False) as data:
+        return {k: data[k] if data[k].ndim else data[k].item() for k in data.files}
+
+def _save_partial(partial, path):
+    # Written under a temporary name and renamed, so a killed run leaves no torn file
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, **partial)
+    os.replace(tmp_path, path)
+
+def _load_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def _save_manifest(cache_dir, manifest):
+    tmp_path = os.path.join(cache_dir, MANIFEST_NAME + ".tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, os.path.join(cache_dir, MANIFEST_NAME))
+
+def merge_movie_partials(titles, partials):
+    """Combines per-movie partials (in title order) into the shape sharded.merge_partials returns."""
+    counts = np.array([p['count'] for p in partials], dtype=np.int64)
+    lo = np.array([shot_store.to_seconds(p['sorted'][(p['count'] - 1) // 2]) for p in partials], dtype=np.float64)
+    hi = np.array([shot_store.to_seconds(p['sorted'][p['count'] // 2]) for p in partials], dtype=np.float64)
+
+    grid = pace_grid.new_pace_grid()
+    if partials:
+        bins = np.concatenate([p['pace_bins'] for p in partials])
+        weights = np.concatenate([p['pace_counts'] for p in partials])
+        grid['counts'] += np.bincount(bins, weights, minlength=grid['counts'].size).astype(np.int64).reshape(grid['counts'].shape)
+    grid['n_movies'] = len(partials)
+    grid['n_shots'] = int(counts.sum())
+
+    return {
+        "summary": {
+            "titles": titles,
+            "counts": counts,
+            "totals": np.array([p['total'] for p in partials], dtype=np.float64),
+            "medians": (lo + hi) / 2
+        },
+        "wasteland_count": sum(p['wasteland'] for p in partials),
+        "coverage_counts": np.sum([p['coverage_counts'] for p in partials], axis=0),
+        "pace_grid": grid,
+        "total": int(counts.sum())
+    }
+
+def compute_partials(mb_df, cache_dir, thresholds=None):
+    """
+    Returns merged partials for mb_df, aggregating only movies missing from the
+    cache in cache_dir. The manifest there maps each title to its content hash;
+    cached partials no movie refers to any more are removed.
+    """
+    if thresholds is None:
+        thresholds = np.linspace(0, 60, 120)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    titles, offsets, grouped, grouped_starts = group_movies(mb_df)
+    hashes = movie_hashes(offsets, grouped, thresholds, grouped_starts)
+    previous = _load_manifest(cache_dir).get("movies", {})
+
+    partials = []
+    rebuilt = []
+    for i, (title, digest) in enumerate(zip(titles, hashes)):
+        path = os.path.join(cache_dir, digest + ".npz")
+        try:
+            partial = _load_partial(path)
+        except (FileNotFoundError, ValueError, OSError):
+            starts = None if grouped_starts is None else grouped_starts[offsets[i]:offsets[i + 1]]
+            partial = movie_partial(grouped[offsets[i]:offsets[i + 1]], thresholds, starts)
+            _save_partial(partial, path)
+            rebuilt.append(title)
+        partials.append(partial)
+
+    current = {str(title): digest for title, digest in zip(titles, hashes)}
+    removed = [title for title in previous if title not in current]
+    _save_manifest(cache_dir, {"version": CACHE_VERSION, "movies": current})
+
+    live = {digest + ".npz" for digest in hashes}
+    for name in os.listdir(cache_dir):
+        if name.endswith(".npz") and name not in live:
+            os.remove(os.path.join(cache_dir, name))
+
+    print(f"Re-aggregated {len(rebuilt)} of {len(titles)} movies ({len(removed)} removed)")
+    return merge_movie_partials(titles, partials)
+
+def get_incremental_stats(mb_df, hero_df, sketch=None, csv_path="data/moviebench_raw.csv", cache_dir=None):
+    """
+    Incremental equivalent of the stats run_analysis prints. The partial cache
+    lives beside the compiled store of csv_path (see shot_store.cache_path), so
+    editing the CSV rebuilds the store but keeps every unchanged movie's partial,
+    unless cache_dir is given.
+    """
+    if cache_dir is None:
+        cache_dir = shot_store.cache_path(csv_path, "partials")
+    thresholds = np.linspace(0, 60, 120)
+    merged = compute_partials(mb_df, cache_dir, thresholds)
+    return stats.stats_from_partials(merged, mb_df, hero_df, thresholds, sketch=sketch)
@@ -0,0 +1,65 @@
+import numpy as np
+
+# Pre-binned runtime x duration count grid behind the 'Heatmap of Pace'.
+#
+# The grid uses the heatmap's fixed bin edges (60 runtime bins over 0-120 min, 50
+# duration bins over 0.5-100s), so it can be updated one film at a time, merged
+# across shards by adding counts, stored next to the data and plotted directly.
+RUNTIME_BINS = 60
+RUNTIME_RANGE = (0, 120)
+DURATION_BINS = 50
+DURATION_RANGE = (0.5, 100)
+
+def new_pace_grid(runtime_bins=RUNTIME_BINS, runtime_range=RUNTIME_RANGE,
+                  duration_bins=DURATION_BINS, duration_range=DURATION_RANGE):
+    """Creates an empty grid."""
+    return {
+        "x_edges": np.linspace(runtime_range[0], runtime_range[1], runtime_bins + 1),
+        "y_edges": np.linspace(duration_range[0], duration_range[1], duration_bins + 1),
+        "counts": np.zeros((runtime_bins, duration_bins), dtype=np.int64),
+        "n_movies": 0,
+        "n_shots": 0
+    }
+
+def add_points(grid, start_time_min, durations):
+    """Adds (start minute, duration) points to the grid in place."""
+    counts, _, _ = np.histogram2d(np.asarray(start_time_min, dtype=np.float64), np.asarray(durations, dtype=np.float64),
+                                  bins=[grid['x_edges'], grid['y_edges']])
+    grid['counts'] += counts.astype(np.int64)
+    grid['n_shots'] += len(durations)
+    return grid
+
+def add_movie(grid, durations, start_times=None):
+    """
+    Adds one film, given its shot durations (s). start_times are the shots' true
+    start times in seconds; without them the shots are taken to be in order and
+    back to back, starting at the running sum of earlier shots.
+    """
+    durations = np.asarray(durations, dtype=np.float64)
+    if start_times is None:
+        start_time_min = (np.cumsum(durations) - durations) / 60.0
+    else:
+        start_time_min = np.asarray(start_times, dtype=np.float64) / 60.0
+    add_points(grid, start_time_min, durations)
+    grid['n_movies'] += 1
+    return grid
+
+def merge_pace_grids(*grids):
+    """Sums grids with identical bin edges into a new grid."""
+    merged = {k: (v.copy() if isinstance(v, np.ndarray) else v) for k, v in grids[0].items()}
+    for grid in grids[1:]:
+        if not (np.array_equal(grid['x_edges'], merged['x_edges']) and np.array_equal(grid['y_edges'], merged['y_edges'])):
+            raise ValueError("Cannot merge pace grids with different bin edges")
+        merged['counts'] += grid['counts']
+        merged['n_movies'] += grid['n_movies']
+        merged['n_shots'] += grid['n_shots']
+    return merged
+
+def save_pace_grid(grid, path, **extra):
+    np.savez(path, **{k: np.asarray(v) for k, v in {**grid, **extra}.items()})
+
+def load_pace_grid(path):
+    """Loads a grid; extra fields saved alongside it come back as plain values."""
+    with np.load(path, allow_pickle=False) as data:
+        grid = {k: data[k] if data[k].ndim else data[k].item() for k in data.files}
+    return grid
@@ -1,8 +1,13 @@
+import argparse
+import multiprocessing
+import os
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
-import os
+import shot_store
 
-# Map log files to movie titles
+# Titles for the original hero logs; other logs are titled from their dialog heading
 LOG_FILES = {
     "Mad Max: Fury Road": "snapshot-2026-01-12T23-22-42-580Z.log",
     "The Bourne Ultimatum": "snapshot-2026-01-12T23-23-06-152Z.log",
@@ -13,69 +18,229 @@ LOG_FILES = {
     "Quantum of Solace": "snapshot-2026-01-12T23-43-21-396Z.log"
 }
 
-LOG_DIR_BROWSER = "/Users/griffin/.cursor/browser-logs/"
+# Directories scanned for logs when none are given. CINEMETRICS_LOG_DIR puts the
+# browser's snapshot directory in front.
 LOG_DIR_LOCAL = "analysis/logs/"
+LOG_DIRS = [d for d in (os.environ.get("CINEMETRICS_LOG_DIR"), LOG_DIR_LOCAL, "data/logs/") if d]
+# The store holds whichever logs this machine has; the stats keep reading the
+# curated data/hero_movies_clean.csv (export the store with --output to refresh it)
+CINEMETRICS_STORE = os.path.join(shot_store.STORE_DIR, "cinemetrics")
+
+# Snapshot lines look like `- generic [ref=e1576]: "1"`; the value follows the last ': '.
+# '.' stops at newlines, so on a block of lines this still matches at most once per line.
+RE_GENERIC_VAL = re.compile(r'- generic.*: "?([^"\n]+)"?')
+BLOCK_CHARS = 1 << 20
+RE_HEADING = re.compile(r'Raw data for “(.+?)”')
+RE_YEAR_SUFFIX = re.compile(r'\s*\(\d{4}(?:,[^)]*)?\)$')
+RE_INT = re.compile(r'^\d+$')
+RE_TC = re.compile(r'^\d{2}:\d{2}\.\d$')
+RE_FLOAT = re.compile(r'^\d+\.?\d*$')
+
+# Cinemetrics dialog text that is not shot data
+UI_STRINGS = frozenset([
+    "Close", "Back", "NoS", "LEN", "ASL", "MSL", "MAX", "MIN", "Range", "StDev", "CV",
+    "Show raw data", "Hide colors", "Show colors"
+])
+
+def new_parse_stats(filepath):
+    return {"file": filepath, "bytes": 0, "lines": 0, "values": 0, "ui_filtered": 0, "shots": 0, "rejected": 0, "seconds": 0.0}
+
+def iter_values(f, parse_stats, block_chars=BLOCK_CHARS):
+    """
+    Yields the data values of a snapshot, skipping UI text and element refs.
+    The file is read in blocks of whole lines and each block is scanned with one
+    findall. Lines are only stripped and matched one at a time in the rare blocks
+    where stripping could change a match.
+    """
+    carry = ''
+    while True:
+        chunk = f.read(block_chars)
+        # Lines as `for line in f` yields them: every newline, plus an unterminated last line
+        parse_stats['lines'] += chunk.count('\n')
+        if chunk:
+            cut = chunk.rfind('\n')
+            if cut < 0:
+                carry += chunk
+                continue
+            block, carry = carry + chunk[:cut], chunk[cut + 1:]
+        else:
+            block, carry = carry, ''
+            parse_stats['lines'] += bool(block)
+        
+        values = RE_GENERIC_VAL.findall(block)
+        if any(val[-1].isspace() for val in values):
+            # Only a value ending in whitespace can come out differently once its line is stripped
+            matches = (RE_GENERIC_VAL.search(line.strip()) for line in block.split('\n'))
+            values = [m.group(1) for m in matches if m]
+        
+        for val in values:
+            if val in UI_STRINGS or "ref=" in val:
+                parse_stats['ui_filtered'] += 1
+                continue
+            parse_stats['values'] += 1
+            yield val
+        
+        if not chunk:
+            return
+
+def iter_shots(values, parse_stats):
+    """
+    Yields (shot_number, start_time, shot_length_sec) from consecutive
+    (int, MM:SS.d timecode, float) value triples. A matched triple is consumed
+    whole; otherwise the window slides by one value.
+    """
+    window = []
+    for val in values:
+        window.append(val)
+        if len(window) < 3:
+            continue
+        v1, v2, v3 = window
+        if RE_INT.match(v1) and RE_TC.match(v2) and RE_FLOAT.match(v3):
+            if int(v1) < 10000:
+                parse_stats['shots'] += 1
+                yield int(v1), v2, float(v3)
+                window = []
+                continue
+            parse_stats['rejected'] += 1
+        del window[0]
 
 def parse_log_file(filepath, movie_title):
-    shots = []
+    """
+    Parses one Cinemetrics raw-data snapshot in a single streaming pass.
+    Returns (shots, parse_stats): shot records for movie_title and the file's
+    line, value and shot counts.
+    """
     print(f"Parsing {movie_title} from {filepath}...")
+    parse_stats = new_parse_stats(filepath)
+    parse_stats['bytes'] = os.path.getsize(filepath)
+    started = time.perf_counter()
+
+    with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
+        shots = [
+            {"movie_title": movie_title, "shot_number": number, "start_time": start, "shot_length_sec": length}
+            for number, start, length in iter_shots(iter_values(f, parse_stats), parse_stats)
+        ]
+
+    parse_stats['seconds'] = time.perf_counter() - started
+    print(f"Found {len(shots)} shots for {movie_title} "
+          f"({parse_stats['lines']} lines, {parse_stats['values']} values, {parse_stats['ui_filtered']} UI strings, "
+          f"{parse_stats['rejected']} rejected, {parse_stats['seconds']:.3f}s)")
+    return shots, parse_stats
+
+def read_heading(filepath):
+    """
+    Returns the film named in the snapshot's dialog heading, e.g.
+    'John Wick: Chapter 4 (2023, USA)' from `Raw data for “John Wick: Chapter 4 (2023, USA)”`,
+    or None. Reading stops at the heading, which sits at the top of the snapshot.
+    """
+    with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            match = RE_HEADING.search(line)
+            if match:
+                return match.group(1)
+    return None
+
+def infer_title(filepath, heading):
+    """Movie title for a log: the LOG_FILES name, else the heading without its (year, country), else the file name."""
+    filename = os.path.basename(filepath)
+    for title, known_file in LOG_FILES.items():
+        if known_file == filename:
+            return title
+    if heading:
+        return RE_YEAR_SUFFIX.sub('', heading) or heading
+    return os.path.splitext(filename)[0]
+
+def discover_logs(log_dirs):
+    """All *.log files in log_dirs, sorted by path."""
+    paths = []
+    for log_dir in log_dirs:
+        if os.path.isdir(log_dir):
+            paths.extend(os.path.join(log_dir, name) for name in os.listdir(log_dir) if name.endswith('.log'))
+    return sorted(set(paths))
+
+def log_key(filepath):
+    """
+    Segment key for a log: its path relative to the working directory (the repo
+    root), or its absolute path outside it, so same-named logs in different
+    directories stay separate films.
+    """
+    path = os.path.abspath(filepath)
+    relative = os.path.relpath(path)
+    return path if relative.startswith(os.pardir) else relative
+
+def ingest_log(filepath, known_versions):
+    """
+    Worker: parses one log unless its content hash is in known_versions.
+    Returns the segment key, version and shot frame plus the parse stats.
+    """
+    version = shot_store.file_sha256(filepath)
+    if version in known_versions:
+        return {"path": filepath, "skipped": True}
     
-    with open(filepath, 'r') as f:
-        content = f.read()
+    heading = read_heading(filepath)
+    title = infer_title(filepath, heading)
+    shots, parse_stats = parse_log_file(filepath, title)
+    shots_df = pd.DataFrame(shots, columns=["movie_title", "shot_number", "start_time", "shot_length_sec"])
+    return {"path": filepath, "skipped": False, "key": log_key(filepath), "version": version,
+            "shots": shots_df, "parse_stats": parse_stats}
 
-    lines = content.split('\n')
-    re_generic_val = re.compile(r'- generic.*: "?([^"]+)"?')
-    captured_values = []
+def ingest_logs(log_dirs=None, store_path=CINEMETRICS_STORE, workers=None):
+    """
+    Parses every log in log_dirs with a process pool and appends one segment per
+    log file to the append-only shot store at store_path. Logs whose exact content
+    is already stored are skipped; a log that changed replaces its segment.
+    workers=1 parses in-process. Returns the per-file parse stats.
+    """
+    paths = discover_logs(log_dirs or LOG_DIRS)
+    known_versions = set(shot_store.segment_versions(store_path).values())
+    print(f"Found {len(paths)} logs")
     
-    for line in lines:
-        line = line.strip()
-        match = re_generic_val.search(line)
-        if match:
-            val = match.group(1)
-            # Filter UI text
-            if val in ["Close", "Back", "NoS", "LEN", "ASL", "MSL", "MAX", "MIN", "Range", "StDev", "CV", "Show raw data", "Hide colors", "Show colors"]:
-                continue
-            if "ref=" in val: continue
-            captured_values.append(val)
-            
-    re_int = re.compile(r'^\d+$')
-    re_tc = re.compile(r'^\d{2}:\d{2}\.\d$')
-    re_float = re.compile(r'^\d+\.?\d*$')
+    if workers == 1:
+        results = (ingest_log(path, known_versions) for path in paths)
+        return _store_results(results, store_path)
     
-    i = 0
-    while i < len(captured_values) - 2:
-        v1 = captured_values[i]
-        v2 = captured_values[i+1]
-        v3 = captured_values[i+2]
-        
-        if re_int.match(v1) and re_tc.match(v2) and re_float.match(v3):
-            if int(v1) < 10000:
-                shots.append({
-                    "movie_title": movie_title,
-                    "shot_number": int(v1),
-                    "start_time": v2,
-                    "shot_length_sec": float(v3)
-                })
-                i += 3
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, mp_context=context) as pool:
+        results = pool.map(ingest_log, paths, [known_versions] * len(paths), chunksize=8)
+        return _store_results(results, store_path)
+
+def _store_results(results, store_path):
+    all_stats = []
+    skipped = 0
+    
+    def frames():
+        nonlocal skipped
+        for result in results:
+            if result["skipped"]:
+                skipped += 1
                 continue
-        i += 1
+            all_stats.append(result["parse_stats"])
+            if result["shots"].empty:
+                print(f"No shots found in {result['path']}, not stored")
+                continue
+            yield result["key"], result["version"], result["shots"]
     
-    print(f"Found {len(shots)} shots for {movie_title}")
-    return shots
-
-all_shots = []
-for title, filename in LOG_FILES.items():
-    path = os.path.join(LOG_DIR_BROWSER, filename)
-    if not os.path.exists(path):
-        path = os.path.join(LOG_DIR_LOCAL, filename)
-        
-    if os.path.exists(path):
-        all_shots.extend(parse_log_file(path, title))
-    else:
-        print(f"File not found: {filename}")
-
-df = pd.DataFrame(all_shots)
-output_path = "analysis/data/real_shots.csv"
-df.to_csv(output_path, index=False)
-print(f"Saved {len(df)} total shots to {output_path}")
-print(df.groupby('movie_title')['shot_length_sec'].describe())
+    written = shot_store.append_frames(store_path, frames())
+    print(f"Stored {len(written)} logs in {store_path} ({skipped} logs already ingested)")
+    return all_stats
+
+def main(log_dirs=None, store_path=CINEMETRICS_STORE, workers=None, output_path=None):
+    ingest_logs(log_dirs, store_path, workers)
+    
+    if output_path:
+        df = shot_store.open_segments(store_path)
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        df.to_csv(output_path, index=False)
+        print(f"Saved {len(df)} total shots to {output_path}")
+        if not df.empty:
+            print(df.groupby('movie_title')['shot_length_sec'].describe())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest a directory of Cinemetrics raw-data browser snapshots into the shot store")
+    parser.add_argument("log_dirs", nargs='*', help="Directories of snapshot logs (default: $CINEMETRICS_LOG_DIR, analysis/logs/, data/logs/)")
+    parser.add_argument("--store", default=CINEMETRICS_STORE, help="Append-only shot store to add the films to")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (1 parses in-process)")
+    parser.add_argument("--output", default=None, help="Also export every stored shot to this CSV")
+    args = parser.parse_args()
+    
+    main(args.log_dirs or None, args.store, args.workers, args.output)
@@ -0,0 +1,150 @@
+import contextlib
+import cProfile
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+
+# Stage-level instrumentation for the pipeline. Each stage records wall time, CPU
+# time, RSS and row counts as a Chrome trace event ("X" complete events plus an
+# RSS counter), so a run can be opened in chrome://tracing or Perfetto.
+# Timestamps come from perf_counter, which on Linux is system-wide, so events
+# recorded in worker processes line up with the parent's.
+PROFILERS = ("cprofile", "tracemalloc")
+
+def new_tracer(profile=None, profile_dir=None):
+    """
+    Creates a tracer. profile is None, 'cprofile' (one .prof file per stage in
+    profile_dir) or 'tracemalloc' (Python allocation peak and top sites per stage).
+    """
+    if profile not in (None,) + PROFILERS:
+        raise ValueError(f"Unknown profiler {profile!r}; expected one of {PROFILERS}")
+    return {"events": [], "profile": profile, "profile_dir": profile_dir, "pid": os.getpid(), "depth": 0}
+
+def now_us():
+    return time.perf_counter_ns() // 1000
+
+def _read_status_mb(field):
+    # VmRSS / VmHWM from /proc (Linux); None elsewhere
+    try:
+        with open("/proc/self/status", 'r') as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def _reset_peak_rss():
+    # Writing 5 to clear_refs resets VmHWM, giving a per-stage peak; fails quietly elsewhere
+    try:
+        with open("/proc/self/clear_refs", 'w') as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def memory_mb():
+    """Returns (current RSS, peak RSS) of this process in MB."""
+    peak = _read_status_mb("VmHWM")
+    if peak is None:
+        # ru_maxrss is KB on Linux, bytes on macOS; lifetime peak only
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return _read_status_mb("VmRSS"), peak
+
+def add_event(tracer, name, start_us, dur_us, args, pid=None, tid=None, cat="stage"):
+    """Appends one complete event; used for stages timed elsewhere (e.g. render workers)."""
+    if tracer is None:
+        return
+    tracer["events"].append({
+        "name": name, "cat": cat, "ph": "X", "ts": start_us, "dur": dur_us,
+        "pid": pid or tracer["pid"], "tid": tid or threading.get_ident(), "args": args
+    })
+
+@contextlib.contextmanager
+def stage(tracer, name, rows=None):
+    """
+    Times the enclosed block as a pipeline stage. Yields a dict the block can add
+    fields to (e.g. info['rows'] = len(df)); they end up in the event's args.
+    With tracer=None this does nothing.
+    Stages nest: only the outermost one resets the peak RSS and runs the profiler,
+    so a nested stage reports the peak since its enclosing stage began and its
+    allocations and calls are counted in the enclosing stage's profile.
+    """
+    info = {} if rows is None else {"rows": rows}
+    if tracer is None:
+        yield info
+        return
+
+    outermost = tracer["depth"] == 0
+    per_stage_peak = outermost and _reset_peak_rss()
+    rss_before, _ = memory_mb()
+    profiler = None
+    if outermost and tracer["profile"] == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif outermost and tracer["profile"] == "tracemalloc":
+        tracemalloc.start()
+
+    tracer["depth"] += 1
+    start_us = now_us()
+    cpu_start = time.process_time()
+    try:
+        yield info
+    finally:
+        tracer["depth"] -= 1
+        wall_us = now_us() - start_us
+        cpu_s = time.process_time() - cpu_start
+        rss_after, peak = memory_mb()
+
+        args = dict(info)
+        args.update({
+            "wall_s": wall_us / 1e6,
+            "cpu_s": cpu_s,
+            "rss_before_mb": rss_before,
+            "rss_after_mb": rss_after,
+            "peak_rss_mb": peak,
+            "peak_rss_scope": ("stage" if per_stage_peak else "process") if outermost else "enclosing stage"
+        })
+
+        if profiler is not None:
+            profiler.disable()
+            profile_dir = tracer["profile_dir"] or "."
+            os.makedirs(profile_dir, exist_ok=True)
+            path = os.path.join(profile_dir, f"{len(tracer['events']):03d}-{name.replace('/', '_')}.prof")
+            profiler.dump_stats(path)
+            args["cprofile"] = path
+        elif outermost and tracer["profile"] == "tracemalloc":
+            snapshot = tracemalloc.take_snapshot()
+            args["py_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+            args["top_allocations"] = [str(s) for s in snapshot.statistics('lineno')[:10]]
+            tracemalloc.stop()
+
+        add_event(tracer, name, start_us, wall_us, args)
+        tracer["events"].append({
+            "name": "rss_mb", "ph": "C", "ts": start_us + wall_us, "pid": tracer["pid"],
+            "args": {"rss": rss_after, "peak": peak}
+        })
+
+def summarize(tracer):
+    """Prints one line per stage: wall, CPU, peak RSS and rows."""
+    for event in tracer["events"]:
+        if event["ph"] != "X":
+            continue
+        args = event["args"]
+        line = f"  {event['name']}: wall={args['wall_s']:.3f}s cpu={args['cpu_s']:.3f}s"
+        if args.get("peak_rss_mb") is not None:
+            line += f" peak_rss={args['peak_rss_mb']:.0f}MB"
+        if "py_peak_mb" in args:
+            line += f" py_peak={args['py_peak_mb']:.1f}MB"
+        if "rows" in args:
+            line += f" rows={args['rows']}"
+        print(line)
+
+def save_trace(tracer, path):
+    """Writes the Chrome trace JSON (open in chrome://tracing or ui.perfetto.dev)."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({"traceEvents": tracer["events"], "displayTimeUnit": "ms"}, f, indent=1)
@@ -0,0 +1,177 @@
+import math
+import numpy as np
+
+# Mergeable quantile sketch for shot durations: a fixed log-bucket histogram.
+#
+# Bucket i (1..n) covers (MIN_VALUE * gamma^(i-1), MIN_VALUE * gamma^i] with
+# gamma = (1 + a) / (1 - a), so reporting the bucket's midpoint keeps every value
+# within a relative error `a` (relative_accuracy) of the true one. Values at or
+# below MIN_VALUE land in an underflow bucket, values above MAX_VALUE in an
+# overflow bucket; both are reported as the tracked min/max.
+#
+# Error bounds:
+#   quantile  within relative_accuracy of the order statistic at rank floor(q * (n - 1))
+#   std/mean  exact up to float64 rounding (kept as running moments)
+#   cdf/share off by at most the share of shots in the bucket holding each endpoint
+#
+# The bucket layout is fixed by the parameters, so merging sketches built from
+# separate shards is an element-wise sum and loses nothing.
+RELATIVE_ACCURACY = 0.001
+MIN_VALUE = 1e-3
+MAX_VALUE = 1e5
+
+def new_sketch(relative_accuracy=RELATIVE_ACCURACY, min_value=MIN_VALUE, max_value=MAX_VALUE):
+    """Creates an empty sketch."""
+    gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+    n_buckets = math.ceil(math.log(max_value / min_value) / math.log(gamma))
+    return {
+        "relative_accuracy": relative_accuracy,
+        "min_value": min_value,
+        "max_value": max_value,
+        "counts": np.zeros(n_buckets + 2, dtype=np.int64),
+        "count": 0,
+        "sum": 0.0,
+        "sum_sq": 0.0,
+        "min": math.inf,
+        "max": -math.inf
+    }
+
+def _gamma(sketch):
+    a = sketch['relative_accuracy']
+    return (1 + a) / (1 - a)
+
+def _bucket_of(sketch, values):
+    n_buckets = len(sketch['counts']) - 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        idx = np.ceil(np.log(values / sketch['min_value']) / np.log(_gamma(sketch)))
+    idx = np.where(values <= sketch['min_value'], 0, idx)
+    return np.clip(idx, 0, n_buckets + 1).astype(np.int64)
+
+def _bucket_values(sketch):
+    # Midpoint of each bucket in the relative-error sense
+    gamma = _gamma(sketch)
+    upper = sketch['min_value'] * gamma ** np.arange(len(sketch['counts']), dtype=np.float64)
+    values = 2 * upper / (gamma + 1)
+    values[0] = sketch['min']
+    values[-1] = sketch['max']
+    return values
+
+def update_sketch(sketch, values):
+    """Adds a batch of durations to the sketch in place. NaNs are ignored."""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return sketch
+
+    sketch['counts'] += np.bincount(_bucket_of(sketch, values), minlength=len(sketch['counts']))
+    sketch['count'] += len(values)
+    sketch['sum'] += float(values.sum())
+    sketch['sum_sq'] += float(np.dot(values, values))
+    sketch['min'] = min(sketch['min'], float(values.min()))
+    sketch['max'] = max(sketch['max'], float(values.max()))
+    return sketch
+
+def merge_sketches(*sketches):
+    """Combines sketches built with the same parameters into a new one."""
+    first = sketches[0]
+    merged = new_sketch(first['relative_accuracy'], first['min_value'], first['max_value'])
+    for sketch in sketches:
+        if (sketch['relative_accuracy'], sketch['min_value'], sketch['max_value']) != \
+                (merged['relative_accuracy'], merged['min_value'], merged['max_value']):
+            raise ValueError("Cannot merge sketches with different bucket layouts")
+        merged['counts'] += sketch['counts']
+        merged['count'] += sketch['count']
+        merged['sum'] += sketch['sum']
+        merged['sum_sq'] += sketch['sum_sq']
+        merged['min'] = min(merged['min'], sketch['min'])
+        merged['max'] = max(merged['max'], sketch['max'])
+    return merged
+
+def sketch_from_values(values, **params):
+    return update_sketch(new_sketch(**params), values)
+
+def sketch_quantile(sketch, q):
+    """Estimated q-quantile (scalar or array of q) of the sketched durations."""
+    if sketch['count'] == 0:
+        return np.nan
+    rank = np.floor(np.asarray(q, dtype=np.float64) * (sketch['count'] - 1))
+    bucket = np.searchsorted(np.cumsum(sketch['counts']), rank, side='right')
+    values = np.clip(_bucket_values(sketch)[bucket], sketch['min'], sketch['max'])
+    return values if values.ndim else float(values)
+
+def sketch_cdf(sketch, x):
+    """Estimated share of durations <= x (scalar or array), interpolating within a bucket."""
+    if sketch['count'] == 0:
+        return np.nan
+    x = np.asarray(x, dtype=np.float64)
+    counts = sketch['counts']
+    below = np.concatenate([[0], np.cumsum(counts)])
+    bucket = _bucket_of(sketch, x)
+
+    # Position of x inside its bucket, linear in log space
+    gamma = _gamma(sketch)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pos = np.log(x / sketch['min_value']) / np.log(gamma) - (bucket - 1)
+    inner = (bucket > 0) & (bucket < len(counts) - 1)
+    # Underflow counts fully once x reaches the tracked min; overflow only at the max (below)
+    pos = np.where(inner, np.clip(pos, 0, 1), np.where(bucket == 0, 1.0, 0.0))
+
+    share = (below[bucket] + pos * counts[bucket]) / sketch['count']
+    share = np.where(x < sketch['min'], 0.0, np.where(x >= sketch['max'], 1.0, share))
+    return share if share.ndim else float(share)
+
+def sketch_share_between(sketch, lo, hi):
+    """Estimated share of durations in [lo, hi]."""
+    return sketch_cdf(sketch, hi) - sketch_cdf(sketch, lo)
+
+def sketch_mean(sketch):
+    return sketch['sum'] / sketch['count'] if sketch['count'] else np.nan
+
+def sketch_std(sketch):
+    """Sample standard deviation (ddof=1, matching pandas)."""
+    n = sketch['count']
+    if n < 2:
+        return np.nan
+    var = (sketch['sum_sq'] - sketch['sum'] ** 2 / n) / (n - 1)
+    return math.sqrt(max(var, 0.0))
+
+def kde_bandwidth(sketch, bw_adjust=1.0):
+    """Scott's-rule Gaussian bandwidth (as seaborn's kdeplot uses) from the exact count and std."""
+    return sketch['count'] ** (-1 / 5) * sketch_std(sketch) * bw_adjust
+
+def sketch_kde(sketch, x, bandwidth=None, resolution=50, max_grid=1 << 18):
+    """
+    Gaussian KDE of the sketched durations evaluated at x, computed without the raw
+    values: bucket masses are spread over a uniform grid of spacing
+    bandwidth / resolution (via sketch_cdf), smoothed by an FFT convolution with
+    the Gaussian kernel and interpolated at x. The cost depends on the grid size,
+    not the number of shots.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if sketch['count'] < 2:
+        return np.full(x.shape, np.nan)
+    bandwidth = bandwidth or kde_bandwidth(sketch)
+
+    # The grid covers the data and x with room for the kernel tails, so the
+    # circular convolution does not wrap mass around
+    pad = 6 * bandwidth
+    lo = min(sketch['min'], x.min()) - pad
+    hi = max(sketch['max'], x.max()) + pad
+    n = int(min(max_grid, np.ceil((hi - lo) / (bandwidth / resolution))))
+    width = (hi - lo) / n
+    edges = lo + width * np.arange(n + 1)
+    mass = np.diff(sketch_cdf(sketch, edges))
+
+    freqs = np.fft.rfftfreq(n, d=width)
+    kernel = np.exp(-0.5 * (2 * np.pi * freqs * bandwidth) ** 2)
+    density = np.fft.irfft(np.fft.rfft(mass) * kernel, n) / width
+    return np.interp(x, edges[:-1] + width / 2, density)
+
+def save_sketch(sketch, path):
+    np.savez(path, **{k: np.asarray(v) for k, v in sketch.items()})
+
+def load_sketch(path):
+    with np.load(path) as data:
+        sketch = {k: data[k].item() for k in data.files if k != 'counts'}
+        sketch['counts'] = data['counts'].astype(np.int64)
+    return sketch
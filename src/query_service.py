@@ -0,0 +1,264 @@
+import argparse
+import contextlib
+import json
+import sys
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qsl, urlparse
+import numpy as np
+import pandas as pd
+import shot_store
+import stats
+
+# Long-lived query layer over the stats functions. A service loads the shot data
+# and builds the movie indexes once, then answers parameterized queries from them.
+# Results are kept in an LRU cache keyed by query, parameters and dataset version
+# (the sha256s of the source CSVs), so a changed CSV never serves stale answers.
+MB_CSV = "data/moviebench_raw.csv"
+HERO_CSV = "data/hero_movies_clean.csv"
+CACHE_SIZE = 1024
+DEFAULT_PORT = 8765
+
+def dataset_version(csv_paths=(MB_CSV, HERO_CSV)):
+    """Version string of the stored datasets, from their source CSV hashes."""
+    parts = []
+    for csv_path in csv_paths:
+        try:
+            parts.append(shot_store.source_version(csv_path)[:16])
+        except FileNotFoundError:
+            parts.append("missing")
+    return ":".join(parts)
+
+def new_service(hero_df=None, mb_df=None, version=None, cache_size=CACHE_SIZE):
+    """
+    Creates a query service. Without frames it loads the stored datasets (see
+    stats.load_data) and follows changes to their CSVs through refresh. Frames
+    passed in are served as they are, under version (default: one per frame).
+    """
+    service = {
+        "cache": OrderedDict(),
+        "cache_size": cache_size,
+        "hits": 0,
+        "misses": 0,
+        "from_store": hero_df is None and mb_df is None
+    }
+    if service["from_store"]:
+        _load(service)
+    else:
+        _set_data(service, hero_df, mb_df, version or f"memory-{id(mb_df):x}")
+    return service
+
+def _load(service):
+    version = dataset_version()
+    hero_df, mb_df = stats.load_data()
+    _set_data(service, hero_df, mb_df, version)
+
+def _set_data(service, hero_df, mb_df, version):
+    hero_df = pd.DataFrame() if hero_df is None else hero_df
+    mb_df = pd.DataFrame() if mb_df is None else mb_df
+    service.update(hero_df=hero_df, mb_df=mb_df, version=version)
+    # Built now so the first query of each dataset does not pay for grouping
+    for name in DATASETS:
+        if not service[DATASETS[name][0]].empty:
+            _dataset(service, name)
+
+def refresh(service):
+    """
+    Reloads a store-backed service whose CSVs changed since it loaded them.
+    Costs a stat and a small JSON read per CSV when nothing changed. Returns
+    True if the data was reloaded.
+    """
+    if not service["from_store"] or dataset_version() == service["version"]:
+        return False
+    print(f"Dataset changed, reloading (was {service['version']})")
+    _load(service)
+    return True
+
+# dataset name -> (service key, title column, duration column)
+DATASETS = {
+    "moviebench": ("mb_df", "clean_title", "duration"),
+    "hero": ("hero_df", "movie_title", "shot_length_sec")
+}
+
+def _dataset(service, dataset):
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset {dataset!r}; expected one of {list(DATASETS)}")
+    key, title_col, duration_col = DATASETS[dataset]
+    df = service[key]
+    if df.empty:
+        raise ValueError(f"Dataset {dataset!r} is not loaded")
+    return df, stats.get_movie_index(df, title_col, duration_col), duration_col
+
+def _movie_mask(index, title=None, genre=None, case=False):
+    # Movies whose title contains `title` and that DEFAULT_GENRE_MAP files under `genre`
+    mask = np.ones(len(index['titles']), dtype=bool)
+    if title is not None:
+        mask &= stats.keyword_mask(index, [title], case)
+    if genre is not None:
+        genres, matrix = stats.classify_movies(index, stats.DEFAULT_GENRE_MAP)
+        lowered = [g.lower() for g in genres]
+        if genre.lower() not in lowered:
+            raise ValueError(f"Unknown genre {genre!r}; expected one of {genres}")
+        mask &= matrix[:, lowered.index(genre.lower())]
+    return mask
+
+def _selected_durations(service, title, genre, dataset, case):
+    df, index, duration_col = _dataset(service, dataset)
+    movies = _movie_mask(index, title, genre, case)
+    durations = shot_store.to_seconds(df[duration_col])[stats.rows_for_movies(index, movies)]
+    return movies, durations
+
+def median_shot_length(service, title=None, genre=None, dataset="moviebench", case=False):
+    """Median shot length (s) over every shot of the matching movies."""
+    movies, durations = _selected_durations(service, title, genre, dataset, case)
+    return {
+        "movies": int(movies.sum()),
+        "shots": len(durations),
+        "median": float(np.median(durations)) if len(durations) else None
+    }
+
+def cuts_per_minute(service, genre=None, title=None, dataset="moviebench", case=False):
+    """Median cuts per minute of the matching movies, as stats.get_reid_frequency computes it."""
+    _, index, _ = _dataset(service, dataset)
+    movies = _movie_mask(index, title, genre, case)
+    summary = stats.movie_summary(index)
+    summary = {k: summary[k][movies] for k in stats.SUMMARY_FIELDS}
+    return {
+        "movies": int(movies.sum()),
+        "cuts_per_minute": float(stats.reid_frequency_from_summary(summary))
+    }
+
+def coverage_at(service, seconds, title=None, genre=None, dataset="moviebench", case=False):
+    """% of the matching movies' shots no longer than `seconds`, as on the coverage curve."""
+    _, durations = _selected_durations(service, title, genre, dataset, case)
+    covered = stats.coverage_bin_counts(durations, [seconds])[0]
+    return {
+        "seconds": seconds,
+        "shots": len(durations),
+        "percent_covered": float(covered / len(durations) * 100) if len(durations) else None
+    }
+
+QUERIES = {
+    "median": median_shot_length,
+    "cuts_per_minute": cuts_per_minute,
+    "coverage": coverage_at
+}
+
+def _parse_bool(value):
+    if isinstance(value, str):
+        return value.lower() in ("1", "true", "yes")
+    return bool(value)
+
+# Parameters are coerced before they become part of the cache key, so
+# seconds=10 and seconds="10" (from a URL) share one entry
+PARAM_TYPES = {"title": str, "genre": str, "dataset": str, "case": _parse_bool, "seconds": float}
+
+def query(service, name, **params):
+    """
+    Answers query `name` (see QUERIES) with params, from the cache when possible.
+    The result dict is shared with the cache; treat it as read-only.
+    """
+    if name not in QUERIES:
+        raise ValueError(f"Unknown query {name!r}; expected one of {list(QUERIES)}")
+    unknown = set(params) - set(PARAM_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown parameters {sorted(unknown)}")
+    params = {k: PARAM_TYPES[k](v) for k, v in params.items() if v is not None}
+
+    cache = service["cache"]
+    key = (name, json.dumps(params, sort_keys=True), service["version"])
+    if key in cache:
+        cache.move_to_end(key)
+        service["hits"] += 1
+        return cache[key]
+
+    result = QUERIES[name](service, **params)
+    service["misses"] += 1
+    cache[key] = result
+    if len(cache) > service["cache_size"]:
+        cache.popitem(last=False)
+    return result
+
+def describe(service):
+    """Dataset version, available queries and cache counters."""
+    return {
+        "version": service["version"],
+        "queries": {name: func.__doc__ for name, func in QUERIES.items()},
+        "rows": {name: len(service[DATASETS[name][0]]) for name in DATASETS},
+        "cache": {"entries": len(service["cache"]), "size": service["cache_size"],
+                  "hits": service["hits"], "misses": service["misses"]}
+    }
+
+def _handler_for(service):
+    class QueryHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            name = url.path.strip('/')
+            params = dict(parse_qsl(url.query))
+            started = time.perf_counter()
+
+            if name == "":
+                status, body = 200, describe(service)
+            elif name not in QUERIES:
+                status, body = 404, {"error": f"Unknown query {name!r}; expected one of {list(QUERIES)}"}
+            else:
+                try:
+                    refresh(service)
+                    result = query(service, name, **params)
+                    status, body = 200, {"query": name, "params": params, "version": service["version"], "result": result}
+                except (ValueError, TypeError) as e:
+                    status, body = 400, {"error": str(e)}
+            body["ms"] = (time.perf_counter() - started) * 1000
+
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return QueryHandler
+
+def serve(service, host="127.0.0.1", port=DEFAULT_PORT):
+    """
+    Serves queries over HTTP until interrupted, e.g.
+    GET /median?title=Harry%20Potter, /cuts_per_minute?genre=Action, /coverage?seconds=10.
+    GET / describes the service. Requests are handled one at a time.
+    """
+    server = HTTPServer((host, port), _handler_for(service))
+    print(f"Serving shot-length queries on http://{host}:{port}/ (dataset {service['version']})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer shot-length queries from the stored datasets, once or as a local HTTP server")
+    parser.add_argument("query", choices=["serve"] + list(QUERIES), help="Query to run, or 'serve' to start the HTTP server")
+    parser.add_argument("--title", default=None, help="Only movies whose title contains this text")
+    parser.add_argument("--genre", default=None, help=f"Only movies of this genre ({', '.join(stats.DEFAULT_GENRE_MAP)})")
+    parser.add_argument("--seconds", type=float, default=None, help="Clip length for the coverage query")
+    parser.add_argument("--dataset", choices=list(DATASETS), default=None, help="Dataset to query (default: moviebench)")
+    parser.add_argument("--case", action="store_true", help="Match --title case-sensitively")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to serve on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to serve on")
+    args = parser.parse_args()
+    if args.query == "coverage" and args.seconds is None:
+        parser.error("the coverage query needs --seconds")
+
+    if args.query == "serve":
+        serve(new_service(), args.host, args.port)
+    else:
+        # Progress output goes to stderr so stdout carries only the JSON answer
+        with contextlib.redirect_stdout(sys.stderr):
+            service = new_service()
+        try:
+            result = query(service, args.query, title=args.title, genre=args.genre, seconds=args.seconds,
+                           dataset=args.dataset, case=args.case or None)
+        except (ValueError, TypeError) as e:
+            parser.error(str(e))
+        json.dump({"query": args.query, "version": service["version"], "result": result}, sys.stdout, indent=2)
+        print()
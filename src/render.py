@@ -0,0 +1,179 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pipeline_trace
+import shot_store
+
+# Figure render scheduler: each visualization.plot_* call becomes a job that is
+# skipped when its inputs are unchanged and otherwise rendered in a worker process.
+CACHE_DIR = "plots/.render_cache"
+MANIFEST_NAME = "manifest.json"
+# The plotting code and the modules it reads aggregates and times through: a change
+# to any of them can change a figure without changing its inputs
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+PLOT_SOURCES = ("visualization.py", "quantile_sketch.py", "pace_grid.py", "scene_stats.py", "shot_store.py")
+
+def figure_job(plot_name, frame, output_path, **kwargs):
+    """
+    Describes one figure: visualization.<plot_name>(frame, output_path=output_path, **kwargs).
+    Pass only the columns the plot reads; the frame is what gets hashed and shipped.
+    """
+    return {"plot": plot_name, "frame": frame, "output_path": output_path, "kwargs": kwargs}
+
+def _hash_value(digest, value):
+    # Stable content hash of frames, arrays and plain parameters
+    if isinstance(value, pd.DataFrame):
+        digest.update(repr(list(value.columns)).encode())
+        for name in value.columns:
+            _hash_value(digest, value[name])
+    elif isinstance(value, pd.Series):
+        digest.update(str(value.dtype).encode())
+        if isinstance(value.dtype, pd.CategoricalDtype):
+            _hash_value(digest, list(value.cat.categories))
+            _hash_value(digest, np.asarray(value.cat.codes))
+        elif pd.api.types.is_numeric_dtype(value):
+            _hash_value(digest, value.to_numpy())
+        else:
+            digest.update(pd.util.hash_pandas_object(value, index=False).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(f"{value.dtype}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        for key in sorted(value):
+            digest.update(repr(key).encode())
+            _hash_value(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _hash_value(digest, item)
+    else:
+        digest.update(repr(value).encode())
+
+def job_hash(job):
+    """Hash of a job's input frame, parameters and the plotting code itself."""
+    digest = hashlib.sha256()
+    for name in PLOT_SOURCES:
+        with open(os.path.join(SOURCE_DIR, name), 'rb') as f:
+            digest.update(f.read())
+    _hash_value(digest, [job["plot"], job["output_path"], job["kwargs"], job["frame"]])
+    return digest.hexdigest()
+
+def _load_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def _save_manifest(cache_dir, manifest):
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = os.path.join(cache_dir, MANIFEST_NAME + ".tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, os.path.join(cache_dir, MANIFEST_NAME))
+
+def _output_signature(output_path):
+    st = os.stat(output_path)
+    return [st.st_mtime_ns, st.st_size]
+
+def _is_cached(manifest, job, digest):
+    # The figure on disk must be the one we rendered, not just any file at that path
+    entry = manifest.get(job["output_path"])
+    if not isinstance(entry, dict) or entry.get("hash") != digest or not os.path.exists(job["output_path"]):
+        return False
+    return entry.get("output") == _output_signature(job["output_path"])
+
+def _record(manifest, job, digest):
+    manifest[job["output_path"]] = {"hash": digest, "output": _output_signature(job["output_path"])}
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+def _render(plot_name, frame_path, output_path, kwargs):
+    # Runs in a worker: open the shipped frame zero-copy and draw it, timing the
+    # work so the parent can add it to its trace
+    import visualization
+    start_us = pipeline_trace.now_us()
+    cpu_start = time.process_time()
+    frame = shot_store.open_store(frame_path)
+    getattr(visualization, plot_name)(frame, output_path=output_path, **kwargs)
+    return {
+        "start_us": start_us,
+        "wall_us": pipeline_trace.now_us() - start_us,
+        "cpu_s": time.process_time() - cpu_start,
+        "peak_rss_mb": pipeline_trace.memory_mb()[1],
+        "pid": os.getpid()
+    }
+
+def render_figures(jobs, workers=None, force=False, cache_dir=CACHE_DIR, tracer=None):
+    """
+    Renders figure jobs, skipping any whose job_hash matches the last render of
+    the same output. Remaining jobs go to a process pool (Agg backend); their
+    frames are handed over as memory-mapped column files rather than pickled.
+    workers=1 renders in-process. Returns the list of output paths rendered.
+    With a pipeline_trace tracer each rendered figure becomes a stage event.
+    """
+    manifest = _load_manifest(cache_dir)
+    pending = []
+    for job in jobs:
+        digest = job_hash(job)
+        if not force and _is_cached(manifest, job, digest):
+            print(f"Unchanged, skipping {job['output_path']}")
+            continue
+        pending.append((job, digest))
+
+    if not pending:
+        return []
+
+    for job, _ in pending:
+        os.makedirs(os.path.dirname(job["output_path"]) or '.', exist_ok=True)
+
+    rendered = []
+    if workers == 1:
+        _init_worker()
+        import visualization
+        for job, digest in pending:
+            with pipeline_trace.stage(tracer, job["plot"], rows=len(job["frame"])):
+                getattr(visualization, job["plot"])(job["frame"], output_path=job["output_path"], **job["kwargs"])
+            _record(manifest, job, digest)
+            rendered.append(job["output_path"])
+        _save_manifest(cache_dir, manifest)
+        return rendered
+
+    frames_dir = os.path.join(cache_dir, "frames")
+    try:
+        futures = []
+        # spawn keeps workers independent of whatever backend the parent has loaded
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers or min(len(pending), os.cpu_count() or 1),
+                                 mp_context=context, initializer=_init_worker) as pool:
+            for job, digest in pending:
+                frame_path = os.path.join(frames_dir, digest)
+                shot_store.save_frame(job["frame"], frame_path)
+                futures.append((pool.submit(_render, job["plot"], frame_path, job["output_path"], job["kwargs"]), job, digest))
+
+            for future, job, digest in futures:
+                try:
+                    timing = future.result()
+                except Exception as e:
+                    print(f"Error rendering {job['output_path']}: {e}")
+                    continue
+                _record(manifest, job, digest)
+                rendered.append(job["output_path"])
+                pipeline_trace.add_event(tracer, job["plot"], timing["start_us"], timing["wall_us"], {
+                    "rows": len(job["frame"]),
+                    "wall_s": timing["wall_us"] / 1e6,
+                    "cpu_s": timing["cpu_s"],
+                    "peak_rss_mb": timing["peak_rss_mb"],
+                    "peak_rss_scope": "process"
+                }, pid=timing["pid"], tid=timing["pid"])
+    finally:
+        shutil.rmtree(frames_dir, ignore_errors=True)
+        _save_manifest(cache_dir, manifest)
+    return rendered
@@ -1,73 +1,272 @@
+import argparse
+import contextlib
+import json
+import math
+import sys
+import pipeline_trace
+import scene_stats
 import stats
-import visualization
 import pandas as pd
 import os
 
-def main():
+# Plotting (render -> visualization -> matplotlib/seaborn) is imported only once
+# figures are actually requested, so stats-only runs start fast.
+
+def _to_json_value(value):
+    # NaN and infinities (e.g. a stat over no shots) become null: JSON has no literal for them
+    if isinstance(value, dict):
+        return {str(k): _to_json_value(v) for k, v in value.items()}
+    if isinstance(value, pd.DataFrame):
+        return [_to_json_value(row) for row in value.to_dict(orient='records')]
+    if isinstance(value, (list, tuple)):
+        return [_to_json_value(v) for v in value]
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+def main(workers=None, force=False, stats_only=False, shards=None, incremental=False, trace_path=None, profile=None,
+         bootstrap=0, chunked=False, memory_mb=None):
+    """
+    Runs the pipeline and returns the headline stats as a dict.
+    stats_only skips figure rendering and never imports the plotting libraries.
+    shards > 1 computes the stats across that many movie shards in a process pool.
+    incremental reuses cached per-movie aggregates and only re-aggregates changed movies.
+    trace_path writes a Chrome trace of every stage (wall/CPU time, RSS, rows);
+    profile ('cprofile' or 'tracemalloc') additionally profiles each stage.
+    bootstrap > 0 adds 95% confidence intervals from that many movie-level
+    bootstrap replicates (see stats.get_bootstrap_cis).
+    chunked streams the MovieBench shots in batches sized to stay under memory_mb
+    (default chunked.MEMORY_MB) instead of loading them whole; see chunked.
+    """
+    if chunked and (shards or incremental or bootstrap):
+        raise ValueError("chunked mode cannot be combined with shards, incremental or bootstrap")
+    if chunked:
+        import chunked as chunked_stats
+        # Before any data is loaded, so an impossible ceiling fails fast
+        chunked_stats.check_memory_budget(chunked_stats.MEMORY_MB if memory_mb is None else memory_mb)
+    tracer = None
+    if trace_path or profile:
+        profile_dir = (trace_path or "pipeline_trace.json") + ".profiles"
+        tracer = pipeline_trace.new_tracer(profile, profile_dir)
+    try:
+        return _run(tracer, workers, force, stats_only, shards, incremental, bootstrap, chunked, memory_mb)
+    finally:
+        if tracer is not None:
+            print("\n--- Stage Timings ---")
+            pipeline_trace.summarize(tracer)
+            if trace_path:
+                pipeline_trace.save_trace(tracer, trace_path)
+                print(f"Trace written to {trace_path}")
+
+def _run(tracer, workers, force, stats_only, shards, incremental, bootstrap=0, chunked=False, memory_mb=None):
+    stage = lambda name, rows=None: pipeline_trace.stage(tracer, name, rows)
     print("Starting Analysis Pipeline...")
     
     # 1. Load Data
-    hero_df, mb_df = stats.load_data()
+    if chunked:
+        # MovieBench shots are streamed in batches below; only the small hero set is loaded
+        import chunked as chunked_stats
+        with stage("load_hero_data") as info:
+            hero_df = stats.load_hero_data()
+            info['rows'] = len(hero_df)
+        mb_df = None
+        has_shots = os.path.exists(chunked_stats.MB_CSV)
+    else:
+        with stage("load_data") as info:
+            hero_df, mb_df = stats.load_data()
+            info['rows'] = len(hero_df) + len(mb_df)
+        has_shots = not mb_df.empty
+        n_shots = len(mb_df)
     
-    if hero_df.empty or mb_df.empty:
+    if hero_df.empty or not has_shots:
         print("Error: Missing data files in data/. Run fetch/parse scripts first.")
-        return
+        return None
 
     # 2. Generate Stats for README
-    global_stats = stats.get_global_stats(mb_df)
+    # Headline distribution stats come from the mergeable duration sketch
+    # (the chunked path reads or folds its own)
+    duration_sketch = None
+    if not chunked:
+        with stage("load_duration_sketch"):
+            duration_sketch = stats.load_duration_sketch()
+    cost_df = None
+    heatmap_grid = None
+    genre_sketches = None
+    scenes = None
+    if chunked:
+        # Every stat and figure input is folded over the batches, so no shot frame outlives one
+        with stage("chunked.get_chunked_stats") as info:
+            results = chunked_stats.get_chunked_stats(hero_df, memory_mb=chunked_stats.MEMORY_MB if memory_mb is None else memory_mb)
+            info['rows'] = n_shots = results["sketch"]['count'] if results else 0
+        if results is None:
+            print("Error: No MovieBench shots found. Run fetch/parse scripts first.")
+            return None
+        duration_sketch = results.pop("sketch")
+        cost_df = results.pop("coverage")
+        heatmap_grid = results.pop("pace_grid")
+        genre_sketches = results.pop("genre_sketches")
+        scenes = results.pop("scene_stats")
+    elif incremental:
+        import incremental as incremental_stats
+        with stage("incremental.get_incremental_stats", rows=n_shots):
+            results = incremental_stats.get_incremental_stats(mb_df, hero_df, sketch=duration_sketch)
+        cost_df = results.pop("coverage")
+        heatmap_grid = results.pop("pace_grid")
+    elif shards and shards > 1:
+        # Per-movie work fans out across processes; results match the serial path exactly
+        import sharded
+        with stage("sharded.get_sharded_stats", rows=n_shots):
+            results = sharded.get_sharded_stats(mb_df, hero_df, n_shards=shards, sketch=duration_sketch)
+        cost_df = results.pop("coverage")
+        heatmap_grid = results.pop("pace_grid")
+    else:
+        serial_stats = [
+            ("global_stats", "get_global_stats", lambda: stats.get_global_stats(mb_df, sketch=duration_sketch)),
+            ("reid_frequency", "get_reid_frequency", lambda: stats.get_reid_frequency(mb_df)),
+            ("wasteland_pct", "get_wasteland_stat", lambda: stats.get_wasteland_stat(mb_df, sketch=duration_sketch)),
+            ("editorial_bpm", "get_editorial_bpm", lambda: stats.get_editorial_bpm(mb_df, hero_df)),
+            # 3. Generate Blockbuster Specifics
+            ("blockbusters", "get_blockbuster_stats", lambda: stats.get_blockbuster_stats(mb_df, hero_df))
+        ]
+        results = {}
+        for key, name, compute in serial_stats:
+            with stage(f"stats.{name}", rows=n_shots):
+                results[key] = compute()
+    
     print("\n--- GLOBAL STATS (MovieBench) ---")
-    print(global_stats)
+    print(results["global_stats"])
     
     # New Insight Stats
-    reid_freq = stats.get_reid_frequency(mb_df)
-    print(f"Re-ID Frequency (Cuts per min): {reid_freq:.2f}")
-    
-    wasteland_pct = stats.get_wasteland_stat(mb_df)
-    print(f"10-30s Wasteland %: {wasteland_pct:.2f}%")
+    print(f"Re-ID Frequency (Cuts per min): {results['reid_frequency']:.2f}")
+    print(f"10-30s Wasteland %: {results['wasteland_pct']:.2f}%")
     
-    bpm_stats = stats.get_editorial_bpm(mb_df, hero_df)
     print("\n--- Editorial BPM ---")
-    for k, v in bpm_stats.items():
+    for k, v in results["editorial_bpm"].items():
         print(f"{k}: {v:.1f} BPM")
     
-    # 3. Generate Blockbuster Specifics
-    blockbuster_data = stats.get_blockbuster_stats(mb_df, hero_df)
+    # Scene-level pacing needs scene IDs and start times, which older fetch output lacks
+    if not chunked:
+        with stage("stats.get_scene_stats", rows=n_shots):
+            scenes = stats.get_scene_stats(mb_df)
+    if scenes is not None:
+        results["scene_pacing"] = scene_stats.summarize(scenes)
+        print("\n--- Scene Pacing ---")
+        for k, v in results["scene_pacing"].items():
+            print(f"{k}: {v:.2f}" if isinstance(v, float) else f"{k}: {v}")
+    
+    if bootstrap:
+        with stage("stats.get_bootstrap_cis", rows=n_shots) as info:
+            results["confidence_intervals"] = stats.get_bootstrap_cis(mb_df, n_replicates=bootstrap, workers=workers)
+            info['replicates'] = bootstrap
+        # Intervals come from exact replicates, so they are shown around the exact value, not the sketch headline
+        print(f"\n--- 95% Confidence Intervals (movie-level bootstrap, {bootstrap} replicates) ---")
+        for k, ci in results["confidence_intervals"].items():
+            print(f"{k}: {ci['exact']:.2f} exact [{ci['low']:.2f}, {ci['high']:.2f}]")
+    
+    if stats_only:
+        return results
     
     # 4. Generate Visuals
+    import render
     print("\nGenerating Visuals...")
     os.makedirs("plots", exist_ok=True)
     
+    # Each figure is a job; unchanged ones are skipped, the rest render in parallel.
+    # Frames are trimmed to the columns each plot reads so they ship cheaply.
+    jobs = []
+    
     # Visual 1: Barcode (Bourne)
-    bourne_data = stats.get_bourne_data(hero_df)
+    with stage("stats.get_bourne_data", rows=len(hero_df)):
+        bourne_data = stats.get_bourne_data(hero_df)
     if not bourne_data.empty:
-        visualization.plot_barcode_timeline(bourne_data)
+        jobs.append(render.figure_job("plot_barcode_timeline", bourne_data[['shot_number', 'shot_length_sec']],
+                                      "plots/the_20s_ceiling_barcode.png"))
     else:
         print("Warning: Bourne Ultimatum data not found for barcode plot.")
         
     # Visual 2: CDF (MovieBench)
-    visualization.plot_cumulative_density(mb_df)
+    # With the sketch the curve is drawn from its buckets, so no shots need shipping
+    cdf_frame = pd.DataFrame() if duration_sketch is not None else mb_df[['duration']]
+    jobs.append(render.figure_job("plot_cumulative_density", cdf_frame,
+                                  "plots/cumulative_density.png", sketch=duration_sketch))
     
     # Visual 3: Scatter (Blockbusters)
-    visualization.plot_ceiling_scatter(blockbuster_data)
+    jobs.append(render.figure_job("plot_ceiling_scatter", results["blockbusters"], "plots/distribution_histogram.png"))
     
     # NEW Visuals
     
-    # Heatmap Data
-    heatmap_df = stats.get_heatmap_data(mb_df)
-    visualization.plot_heatmap_of_pace(heatmap_df)
+    # Heatmap Data: pre-binned counts kept next to the data, so no per-shot frame ships
+    if heatmap_grid is None:
+        with stage("stats.load_pace_grid", rows=n_shots):
+            heatmap_grid = stats.load_pace_grid(mb_df)
+    jobs.append(render.figure_job("plot_heatmap_of_pace", pd.DataFrame(), "plots/heatmap_pace.png", grid=heatmap_grid))
     
     # Genre Fingerprint
-    genre_df = stats.get_genre_data(mb_df)
-    if not genre_df.empty:
-        visualization.plot_genre_fingerprint(genre_df)
+    # Densities come from per-genre sketches (binned, FFT-smoothed KDE) rather than every labelled shot
+    if genre_sketches is None:
+        with stage("stats.get_genre_sketches", rows=n_shots):
+            genre_sketches = stats.get_genre_sketches(mb_df)
+    if genre_sketches:
+        jobs.append(render.figure_job("plot_genre_fingerprint", pd.DataFrame(),
+                                      "plots/genre_fingerprint.png", sketches=genre_sketches))
     else:
         print("Warning: Could not extract genre data for fingerprint plot.")
         
     # Cost of Consistency
-    cost_df = stats.get_cost_consistency_data(mb_df)
-    visualization.plot_cost_of_consistency(cost_df)
+    if cost_df is None:
+        with stage("stats.get_cost_consistency_data", rows=n_shots):
+            cost_df = stats.get_cost_consistency_data(mb_df)
+    jobs.append(render.figure_job("plot_cost_of_consistency", cost_df, "plots/cost_of_consistency.png"))
+    
+    with stage("render_figures") as info:
+        info['rendered'] = len(render.render_figures(jobs, workers=workers, force=force, tracer=tracer))
     
     print("\nAnalysis Complete. Check plots/ and README.md.")
+    return results
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Compute shot-length stats and render the README figures")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes for figure rendering and bootstrap replicates (1 runs in-process)")
+    parser.add_argument("--force", action="store_true", help="Re-render figures even if their inputs are unchanged")
+    parser.add_argument("--stats-only", action="store_true", help="Print the stats and skip figures (no plotting imports)")
+    parser.add_argument("--shards", type=int, default=None, help="Compute the stats across N movie shards in parallel")
+    parser.add_argument("--incremental", action="store_true", help="Only re-aggregate movies whose shots changed since the last run")
+    parser.add_argument("--trace", default=None, help="Write a Chrome trace JSON of every stage to this path")
+    parser.add_argument("--profile", choices=pipeline_trace.PROFILERS, default=None,
+                        help="Also profile each stage (cProfile files or tracemalloc peaks, next to the trace)")
+    parser.add_argument("--bootstrap", type=int, default=0, metavar="N",
+                        help="Add 95%% confidence intervals from N movie-level bootstrap replicates (e.g. 10000)")
+    parser.add_argument("--chunked", action="store_true",
+                        help="Stream the MovieBench shots in bounded batches instead of loading them whole")
+    parser.add_argument("--memory-mb", type=int, default=None,
+                        help="Memory ceiling for --chunked in MB (default 2048)")
+    parser.add_argument("--json", action="store_true", help="Write the stats to stdout as JSON; implies --stats-only")
+    args = parser.parse_args()
+    if args.chunked and (args.shards or args.incremental or args.bootstrap):
+        parser.error("--chunked cannot be combined with --shards, --incremental or --bootstrap")
+    if args.memory_mb is not None and not args.chunked:
+        parser.error("--memory-mb only applies with --chunked")
+    if args.chunked:
+        import chunked as chunked_stats
+        try:
+            chunked_stats.check_memory_budget(chunked_stats.MEMORY_MB if args.memory_mb is None else args.memory_mb)
+        except ValueError as e:
+            parser.error(str(e))
+    
+    if args.json:
+        # Progress output goes to stderr so stdout carries only the JSON document
+        with contextlib.redirect_stdout(sys.stderr):
+            results = main(workers=args.workers, stats_only=True, shards=args.shards, incremental=args.incremental,
+                           trace_path=args.trace, profile=args.profile, bootstrap=args.bootstrap,
+                           chunked=args.chunked, memory_mb=args.memory_mb)
+        if results is None:
+            sys.exit(1)
+        json.dump(_to_json_value(results), sys.stdout, indent=2, allow_nan=False)
+        print()
+    else:
+        main(workers=args.workers, force=args.force, stats_only=args.stats_only, shards=args.shards,
+             incremental=args.incremental, trace_path=args.trace, profile=args.profile, bootstrap=args.bootstrap,
+             chunked=args.chunked, memory_mb=args.memory_mb)
@@ -0,0 +1,233 @@
+import numpy as np
+import pandas as pd
+
+# Scene-level and runtime-position pacing, accumulated in the same single pass over
+# (movie, scene, start, duration) shots that feeds the duration sketch and pace grid.
+#
+# Each call folds in complete movies: one row per scene (shot count, first start,
+# last end, summed shot length) plus two fixed-bin profiles of shot count and summed
+# shot length, one by position within the film's runtime and one by position within
+# the scene. A shot is placed by its midpoint: binning by start would put a long
+# closing shot in an earlier bin and leave the last bin to the short shots that
+# start in it. Scene rows concatenate and profile bins add (shot lengths are summed
+# in whole milliseconds), so aggregates of disjoint movies (stream chunks, shards)
+# merge exactly, in any grouping; check_merge verifies this.
+RUNTIME_POSITION_BINS = 20
+SCENE_POSITION_BINS = 10
+SCENE_FIELDS = ("movie_title", "scene_id", "shots", "start_time", "end_time", "duration_sum")
+
+def new_scene_stats(runtime_position_bins=RUNTIME_POSITION_BINS, scene_position_bins=SCENE_POSITION_BINS):
+    """Creates an empty aggregate."""
+    return {
+        "scenes": {field: [] for field in SCENE_FIELDS},
+        "runtime_counts": np.zeros(runtime_position_bins, dtype=np.int64),
+        "runtime_duration_ms": np.zeros(runtime_position_bins, dtype=np.int64),
+        "scene_position_counts": np.zeros(scene_position_bins, dtype=np.int64),
+        "scene_position_duration_ms": np.zeros(scene_position_bins, dtype=np.int64),
+        "n_movies": 0,
+        "n_shots": 0
+    }
+
+def _position_bins(position, n_bins):
+    # position in [0, 1] -> bin index; the end of the range falls in the last bin
+    return np.minimum((position * n_bins).astype(np.int64), n_bins - 1)
+
+def _bin_sums(bins, values, n_bins):
+    # Integer bincount with weights (np.bincount would sum in float64)
+    sums = np.zeros(n_bins, dtype=np.int64)
+    np.add.at(sums, bins, values)
+    return sums
+
+def add_shots(agg, titles, scene_ids, start_times, durations):
+    """
+    Folds shots into agg in place. Arguments are aligned per shot, times in
+    seconds, in any order; every movie passed must be complete, since its runtime
+    and scene boundaries are read off the shots given.
+    """
+    durations = np.asarray(durations, dtype=np.float64)
+    if len(durations) == 0:
+        return agg
+    starts = np.asarray(start_times, dtype=np.float64)
+    ends = starts + durations
+    midpoints = starts + durations / 2
+    duration_ms = np.rint(durations * 1000).astype(np.int64)
+
+    movie_codes, movie_titles = pd.factorize(np.asarray(titles, dtype=object))
+    scene_id_codes, scene_id_values = pd.factorize(np.asarray(scene_ids).astype(str))
+    scene_codes, scene_keys = pd.factorize(movie_codes.astype(np.int64) * len(scene_id_values) + scene_id_codes)
+    n_scenes = len(scene_keys)
+
+    scene_start = np.full(n_scenes, np.inf)
+    scene_end = np.full(n_scenes, -np.inf)
+    np.minimum.at(scene_start, scene_codes, starts)
+    np.maximum.at(scene_end, scene_codes, ends)
+    scene_shots = np.bincount(scene_codes, minlength=n_scenes)
+
+    movie_start = np.full(len(movie_titles), np.inf)
+    movie_end = np.full(len(movie_titles), -np.inf)
+    np.minimum.at(movie_start, movie_codes, starts)
+    np.maximum.at(movie_end, movie_codes, ends)
+
+    # Pace vs runtime position: where in the film each shot's midpoint falls, as a share of its runtime
+    runtime = movie_end - movie_start
+    position = (midpoints - movie_start[movie_codes]) / np.where(runtime > 0, runtime, 1)[movie_codes]
+    bins = _position_bins(position, len(agg['runtime_counts']))
+    agg['runtime_counts'] += np.bincount(bins, minlength=len(agg['runtime_counts']))
+    agg['runtime_duration_ms'] += _bin_sums(bins, duration_ms, len(agg['runtime_counts']))
+
+    # Intra-scene pacing: the same profile within scenes of two or more shots
+    span = (scene_end - scene_start)[scene_codes]
+    multi = (scene_shots[scene_codes] > 1) & (span > 0)
+    position = (midpoints[multi] - scene_start[scene_codes[multi]]) / span[multi]
+    bins = _position_bins(position, len(agg['scene_position_counts']))
+    agg['scene_position_counts'] += np.bincount(bins, minlength=len(agg['scene_position_counts']))
+    agg['scene_position_duration_ms'] += _bin_sums(bins, duration_ms[multi], len(agg['scene_position_counts']))
+
+    scenes = agg['scenes']
+    scenes['movie_title'].append(np.asarray(movie_titles, dtype=str)[scene_keys // len(scene_id_values)])
+    scenes['scene_id'].append(np.asarray(scene_id_values, dtype=str)[scene_keys % len(scene_id_values)])
+    scenes['shots'].append(scene_shots)
+    scenes['start_time'].append(scene_start)
+    scenes['end_time'].append(scene_end)
+    scenes['duration_sum'].append(np.bincount(scene_codes, durations, minlength=n_scenes))
+
+    agg['n_movies'] += len(movie_titles)
+    agg['n_shots'] += len(durations)
+    return agg
+
+def _scene_arrays(agg, fields=SCENE_FIELDS):
+    # Collapses the per-call chunks of fields into one array each
+    for field in fields:
+        chunks = agg['scenes'][field]
+        if len(chunks) != 1:
+            empty = np.array([], dtype=str if field in ("movie_title", "scene_id") else np.float64)
+            agg['scenes'][field] = [np.concatenate(chunks) if chunks else empty]
+    return {field: agg['scenes'][field][0] for field in fields}
+
+def merge_scene_stats(*aggs):
+    """Combines aggregates of disjoint movies into a new aggregate."""
+    merged = new_scene_stats(len(aggs[0]['runtime_counts']), len(aggs[0]['scene_position_counts']))
+    for agg in aggs:
+        if len(agg['runtime_counts']) != len(merged['runtime_counts']) or \
+                len(agg['scene_position_counts']) != len(merged['scene_position_counts']):
+            raise ValueError("Cannot merge scene stats with different position bins")
+        for field, values in _scene_arrays(agg).items():
+            merged['scenes'][field].append(values)
+        for key in ("runtime_counts", "runtime_duration_ms", "scene_position_counts", "scene_position_duration_ms",
+                    "n_movies", "n_shots"):
+            merged[key] += agg[key]
+    return merged
+
+def _scene_measures(scenes):
+    # Per-scene span, average shot length and cuts per minute from the numeric fields
+    span = scenes['end_time'] - scenes['start_time']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cuts_per_minute = np.where(span > 0, scenes['shots'] / span * 60, np.nan)
+    return {
+        "span": span,
+        "asl": scenes['duration_sum'] / scenes['shots'],
+        "cuts_per_minute": cuts_per_minute
+    }
+
+def scene_table(agg):
+    """
+    One row per scene: shots, start/end time and span (s), average shot length and
+    cuts per minute (NaN for scenes with no span).
+    """
+    scenes = _scene_arrays(agg)
+    return pd.DataFrame({**scenes, **_scene_measures(scenes)})
+
+def _profile(counts, duration_ms):
+    n_bins = len(counts)
+    total = counts.sum()
+    duration_sums = duration_ms / 1000.0
+    return pd.DataFrame({
+        'position': (np.arange(n_bins) + 0.5) / n_bins,
+        'shots': counts,
+        'share': counts / total if total else np.zeros(n_bins),
+        'mean_shot_length': np.divide(duration_sums, counts, out=np.full(n_bins, np.nan), where=counts > 0)
+    })
+
+def runtime_profile(agg):
+    """Shot count and mean shot length by position in the film (0 = opening, 1 = end)."""
+    return _profile(agg['runtime_counts'], agg['runtime_duration_ms'])
+
+def scene_position_profile(agg):
+    """Shot count and mean shot length by position within the scene (multi-shot scenes only)."""
+    return _profile(agg['scene_position_counts'], agg['scene_position_duration_ms'])
+
+def summarize(agg):
+    """Headline scene-level numbers for run_analysis."""
+    # Read off the numeric fields alone; the title and ID strings would cost more than the rest
+    scenes = _scene_arrays(agg, SCENE_FIELDS[2:])
+    if len(scenes['shots']) == 0:
+        return {}
+    measures = _scene_measures(scenes)
+    cuts_per_minute = measures['cuts_per_minute'][~np.isnan(measures['cuts_per_minute'])]
+    runtime = runtime_profile(agg)['mean_shot_length'].to_numpy()
+    within = scene_position_profile(agg)['mean_shot_length'].to_numpy()
+    return {
+        "scenes": len(scenes['shots']),
+        "median_shots_per_scene": float(np.median(scenes['shots'])),
+        "median_scene_asl": float(np.median(measures['asl'])),
+        "median_scene_cuts_per_minute": float(np.median(cuts_per_minute)) if len(cuts_per_minute) else np.nan,
+        "opening_asl": float(runtime[0]),
+        "closing_asl": float(runtime[-1]),
+        "scene_opening_asl": float(within[0]),
+        "scene_closing_asl": float(within[-1])
+    }
+
+def save_scene_stats(agg, path):
+    np.savez(path, **{f"row_{k}": v for k, v in _scene_arrays(agg).items()},
+             **{k: np.asarray(v) for k, v in agg.items() if k != 'scenes'})
+
+def load_scene_stats(path):
+    with np.load(path, allow_pickle=False) as data:
+        agg = {k: data[k] if data[k].ndim else data[k].item() for k in data.files if not k.startswith("row_")}
+        agg['scenes'] = {field: [data[f"row_{field}"]] for field in SCENE_FIELDS}
+    return agg
+
+def check_merge(n_movies=40, seed=0):
+    """
+    Checks on synthetic shots that one batch call, a stream of per-movie calls into
+    one aggregate and a merge of per-movie aggregates give the same scene stats.
+    Raises AssertionError on a mismatch.
+    """
+    rng = np.random.default_rng(seed)
+    movies = []
+    for m in range(n_movies):
+        n_shots = int(rng.integers(1, 400))
+        durations = np.round(rng.lognormal(1.0, 0.8, n_shots), 3)
+        starts = np.concatenate([[0.0], np.cumsum(durations)[:-1]])
+        scene_ids = np.cumsum(rng.random(n_shots) < 0.1)
+        movies.append((np.full(n_shots, f"Movie {m}"), scene_ids, starts, durations))
+    
+    streamed = new_scene_stats()
+    for shots in movies:
+        add_shots(streamed, *shots)
+    # One call over every shot, in shuffled order
+    columns = [np.concatenate(column) for column in zip(*movies)]
+    order = rng.permutation(len(columns[0]))
+    batch = add_shots(new_scene_stats(), *(column[order] for column in columns))
+    merged = merge_scene_stats(*(add_shots(new_scene_stats(), *shots) for shots in movies))
+    
+    def comparable(agg):
+        table = scene_table(agg).sort_values(['movie_title', 'scene_id'], ignore_index=True)
+        profiles = [agg[key] for key in ("runtime_counts", "runtime_duration_ms",
+                                         "scene_position_counts", "scene_position_duration_ms")]
+        return table, profiles, (agg['n_movies'], agg['n_shots']), summarize(agg)
+    
+    expected = comparable(streamed)
+    for name, agg in (("batch", batch), ("merged", merged)):
+        table, profiles, counts, summary = comparable(agg)
+        # Scene duration sums are float and may differ in the last bit with shot order
+        pd.testing.assert_frame_equal(table, expected[0], check_exact=False, rtol=1e-12)
+        assert all(np.array_equal(a, b) for a, b in zip(profiles, expected[1])), f"{name} profiles differ"
+        assert counts == expected[2], f"{name} movie/shot counts differ"
+        assert summary.keys() == expected[3].keys() and \
+            np.allclose(list(summary.values()), list(expected[3].values()), rtol=1e-12, equal_nan=True), \
+            f"{name} summary differs"
+
+if __name__ == "__main__":
+    check_merge()
+    print("Streamed, batch and merged scene stats match")
@@ -0,0 +1,103 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pace_grid
+import stats
+import shot_store
+
+# Sharded execution of the headline stats: shots are partitioned by movie across a
+# process pool, each worker reduces its movies to mergeable partials, and the parent
+# combines them with the same summary-level functions the serial path uses. Per-movie
+# aggregates never span shards and integer counts add exactly, so the results are
+# bit-for-bit equal to the serial run.
+
+def plan_shards(mb_df, n_shards):
+    """
+    Splits movies into at most n_shards contiguous title ranges of roughly equal
+    shot counts. Returns one array of row positions per shard, rows kept in
+    their original order.
+    """
+    titles = mb_df['clean_title'].astype('category')
+    codes = np.asarray(titles.cat.codes, dtype=np.int64)
+    counts = np.bincount(codes[codes >= 0], minlength=len(titles.cat.categories))
+
+    # Cut points at equal shares of the cumulative shot count
+    cumulative = np.cumsum(counts)
+    targets = cumulative[-1] * np.arange(1, n_shards) / n_shards if len(cumulative) else []
+    bounds = np.unique(np.concatenate([[0], np.searchsorted(cumulative, targets, side='right'), [len(counts)]]))
+
+    shard_of_movie = np.repeat(np.arange(len(bounds) - 1), np.diff(bounds))
+    shard_of_row = np.where(codes >= 0, shard_of_movie[np.maximum(codes, 0)], -1)
+    order = np.argsort(shard_of_row, kind='stable')
+    sizes = np.bincount(shard_of_row[shard_of_row >= 0], minlength=len(bounds) - 1)
+    starts = np.searchsorted(shard_of_row[order], 0)
+    return [rows for rows in np.split(order[starts:], np.cumsum(sizes)[:-1]) if len(rows)]
+
+def frame_partials(df, thresholds):
+    """
+    Reduces a frame of complete movies to its movie summary and mergeable counts
+    (also used for the batches of the chunked path).
+    """
+    summary = stats.movie_summary(stats.get_movie_index(df))
+    durations = shot_store.to_seconds(df['duration'])
+    return {
+        "summary": {k: np.asarray(v) for k, v in summary.items()},
+        "wasteland_count": int(stats.in_wasteland(durations).sum()),
+        "coverage_counts": stats.coverage_bin_counts(durations, thresholds),
+        "pace_grid": stats.build_pace_grid(df),
+        "total": len(df)
+    }
+
+def shard_partials(frame_path, thresholds):
+    """Worker: reduce one shard to its movie summary and mergeable counts."""
+    return frame_partials(shot_store.open_store(frame_path), thresholds)
+
+def merge_partials(partials):
+    """Concatenates shard summaries (sorted by title, as the serial index is) and sums counts."""
+    titles = np.concatenate([p['summary']['titles'] for p in partials])
+    order = np.argsort(titles, kind='stable')
+    summary = {
+        key: np.concatenate([p['summary'][key] for p in partials])[order]
+        for key in ('titles', 'counts', 'totals', 'medians')
+    }
+    return {
+        "summary": summary,
+        "wasteland_count": sum(p['wasteland_count'] for p in partials),
+        "coverage_counts": np.sum([p['coverage_counts'] for p in partials], axis=0),
+        "pace_grid": pace_grid.merge_pace_grids(*[p['pace_grid'] for p in partials]),
+        "total": sum(p['total'] for p in partials)
+    }
+
+def compute_partials(mb_df, n_shards=None, thresholds=None):
+    """Runs shard_partials over a process pool and returns the merged partials."""
+    n_shards = n_shards or os.cpu_count() or 1
+    if thresholds is None:
+        thresholds = np.linspace(0, 60, 120)
+
+    scratch_dir = tempfile.mkdtemp(prefix="shards-")
+    try:
+        frame_paths = []
+        columns = ['clean_title', 'duration'] + (['start_time'] if 'start_time' in mb_df else [])
+        for i, rows in enumerate(plan_shards(mb_df, n_shards)):
+            # Workers open their shard zero-copy from the scratch store
+            frame_path = os.path.join(scratch_dir, str(i))
+            shot_store.save_frame(mb_df[columns].iloc[rows], frame_path)
+            frame_paths.append(frame_path)
+
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(n_shards, len(frame_paths)) or 1, mp_context=context) as pool:
+            partials = list(pool.map(shard_partials, frame_paths, [thresholds] * len(frame_paths)))
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return merge_partials(partials)
+
+def get_sharded_stats(mb_df, hero_df, n_shards=None, sketch=None):
+    """
+    Sharded equivalent of the stats run_analysis prints (see stats.stats_from_partials).
+    """
+    thresholds = np.linspace(0, 60, 120)
+    merged = compute_partials(mb_df, n_shards, thresholds)
+    return stats.stats_from_partials(merged, mb_df, hero_df, thresholds, sketch=sketch)
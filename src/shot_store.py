@@ -0,0 +1,368 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import numpy as np
+import pandas as pd
+import quantile_sketch
+
+# Compiled shot store: one memory-mapped .npy file per column plus a meta.json,
+# rebuilt only when the source CSV changes.
+STORE_DIR = "data/store"
+STORE_VERSION = 3
+
+# Compact shot representation: times are fixed-point int32 milliseconds, which
+# holds any cut to the millisecond exactly and caps a single value at ~596 hours.
+# On disk the unit is explicit: meta.json marks millisecond columns with
+# "unit": "ms", and open_store/read_store_rows decode by it. In memory int32 is
+# reserved for ms (compact_frame and the store readers are the only producers), so
+# to_seconds, the one place that decodes, falls back to the dtype when the caller
+# does not pass the unit.
+MILLIS_DTYPE = np.int32
+TIME_UNITS = ("ms", "s")
+TIME_COLUMNS = ("duration", "shot_length_sec", "start_time", "end_time")
+RE_TIMECODE = re.compile(r'^(\d+):(\d+(?:\.\d+)?)$')
+
+def to_millis(seconds):
+    """Rounds seconds to int32 milliseconds."""
+    return np.rint(np.asarray(seconds, dtype=np.float64) * 1000).astype(MILLIS_DTYPE)
+
+def to_seconds(values, unit=None):
+    """
+    Float64 seconds from a time column. unit is 'ms' or 's'; None takes the
+    in-memory convention (int32 is ms, any other numeric dtype is seconds).
+    """
+    values = np.asarray(values)
+    if unit is None:
+        unit = "ms" if values.dtype == MILLIS_DTYPE else "s"
+    elif unit not in TIME_UNITS:
+        raise ValueError(f"Unknown time unit {unit!r}; expected one of {TIME_UNITS}")
+    if unit == "ms":
+        return values / 1000.0
+    return values.astype(np.float64, copy=False)
+
+def timecode_millis(timecodes):
+    """
+    Parses MM:SS.d timecodes (as in Cinemetrics logs) to int32 milliseconds.
+    Returns None unless every value parses.
+    """
+    parts = pd.Series(timecodes, dtype=object).str.extract(RE_TIMECODE)
+    if parts.isna().any().any():
+        return None
+    return (parts[0].astype(np.int64) * 60000 + to_millis(parts[1].astype(np.float64))).to_numpy(dtype=MILLIS_DTYPE)
+
+def _fits_millis(seconds):
+    return np.isfinite(seconds).all() and np.abs(seconds).max(initial=0) * 1000 < np.iinfo(MILLIS_DTYPE).max
+
+def compact_frame(df, time_columns=TIME_COLUMNS):
+    """
+    Returns df in the compact shot representation: time_columns as int32
+    milliseconds (MM:SS.d timecodes included), text as categorical codes (int8/16/32
+    by number of distinct values) and other integers in the smallest type that holds
+    them. Time columns with missing or out-of-range values keep their dtype.
+    """
+    columns = {}
+    for name in df.columns:
+        col = df[name]
+        values = None
+        if name in time_columns and col.dtype != MILLIS_DTYPE:
+            if pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col):
+                seconds = col.to_numpy(dtype=np.float64)
+                values = to_millis(seconds) if _fits_millis(seconds) else None
+            elif not isinstance(col.dtype, pd.CategoricalDtype):
+                values = timecode_millis(col)
+        
+        if values is None:
+            if isinstance(col.dtype, pd.CategoricalDtype):
+                values = col.array
+            elif not pd.api.types.is_numeric_dtype(col):
+                values = pd.Categorical(col)
+            elif pd.api.types.is_integer_dtype(col) and name not in time_columns:
+                values = pd.to_numeric(col, downcast='integer').to_numpy()
+            else:
+                values = col.to_numpy()
+        columns[name] = values
+    return pd.DataFrame(columns, index=df.index)
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _source_signature(csv_path):
+    st = os.stat(csv_path)
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+def _read_meta(store_path):
+    try:
+        with open(os.path.join(store_path, "meta.json"), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def _write_meta(store_path, meta):
+    # Written last and atomically, so a half-built store is never treated as fresh
+    tmp_path = os.path.join(store_path, "meta.json.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(store_path, "meta.json"))
+
+def is_fresh(csv_path, store_path):
+    """
+    Checks whether the store still matches its source CSV.
+    Compares mtime and size first and only hashes the CSV when those differ, so a
+    touched-but-unchanged file does not trigger a rebuild.
+    """
+    meta = _read_meta(store_path)
+    if meta is None or meta.get("version") != STORE_VERSION:
+        return False
+    
+    signature = _source_signature(csv_path)
+    if meta["source"] == signature:
+        return True
+    
+    if meta["sha256"] != file_sha256(csv_path):
+        return False
+    
+    meta["source"] = signature
+    _write_meta(store_path, meta)
+    return True
+
+def _codes_dtype(n_categories):
+    return np.int16 if n_categories < np.iinfo(np.int16).max else np.int32
+
+def _write_columns(df, store_path, float_dtype=None, sketches=False, text_as_categorical=True):
+    # One .npy per column; returns the column entries for meta.json
+    os.makedirs(store_path, exist_ok=True)
+    
+    columns = []
+    for name in df.columns:
+        col = df[name]
+        entry = {"name": str(name)}
+        
+        if isinstance(col.dtype, pd.CategoricalDtype) or not pd.api.types.is_numeric_dtype(col):
+            cat = col.cat if isinstance(col.dtype, pd.CategoricalDtype) else pd.Categorical(col)
+            values = np.asarray(cat.codes).astype(_codes_dtype(len(cat.categories)))
+            entry["kind"] = "categorical"
+            entry["categories"] = [str(c) for c in cat.categories]
+            if not text_as_categorical and not isinstance(col.dtype, pd.CategoricalDtype):
+                entry["as_object"] = True
+        else:
+            is_float = pd.api.types.is_float_dtype(col)
+            is_millis = col.dtype == MILLIS_DTYPE and str(name) in TIME_COLUMNS
+            values = col.to_numpy(dtype=float_dtype or col.dtype) if is_float else col.to_numpy()
+            entry["kind"] = "numeric"
+            if is_millis:
+                entry["unit"] = "ms"
+            if sketches and (is_float or is_millis):
+                entry["sketch"] = f"{len(columns)}.sketch.npz"
+                quantile_sketch.save_sketch(quantile_sketch.sketch_from_values(to_seconds(col.to_numpy())),
+                                            os.path.join(store_path, entry["sketch"]))
+        
+        entry["file"] = f"{len(columns)}.npy"
+        np.save(os.path.join(store_path, entry["file"]), values)
+        columns.append(entry)
+    return columns
+
+def build_store(csv_path, store_path, float_dtype=np.float32):
+    """
+    Compiles a CSV into the columnar store in the compact representation (see
+    compact_frame): time columns become int32 milliseconds, text columns are
+    dictionary-encoded as integer codes into a category table kept in meta.json,
+    and any other float columns are narrowed to float_dtype. Time and float
+    columns also get a quantile sketch built from the full-precision values.
+    
+    The new store is written to a sibling directory and swapped in. Processes that
+    still have the old column files memory-mapped keep reading them (unlinked, not
+    truncated), and derived files kept in the old store (e.g. the pace grid) go
+    with it.
+    """
+    df = compact_frame(pd.read_csv(csv_path))
+    build_path = f"{store_path}.build-{os.getpid()}"
+    shutil.rmtree(build_path, ignore_errors=True)
+    columns = _write_columns(df, build_path, float_dtype=float_dtype, sketches=True)
+    
+    _write_meta(build_path, {
+        "version": STORE_VERSION,
+        "source": _source_signature(csv_path),
+        "sha256": file_sha256(csv_path),
+        "rows": len(df),
+        "columns": columns
+    })
+    
+    # A directory can only be renamed onto an empty one, so the old store steps aside first
+    old_path = f"{store_path}.old-{os.getpid()}"
+    if os.path.exists(store_path):
+        os.rename(store_path, old_path)
+    os.rename(build_path, store_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+def save_frame(df, store_path):
+    """
+    Writes an in-memory frame in store layout so another process can open it
+    zero-copy with open_store. Dtypes are kept as they are; text columns round-trip
+    as plain object columns.
+    """
+    columns = _write_columns(df, store_path, text_as_categorical=False)
+    _write_meta(store_path, {"version": STORE_VERSION, "rows": len(df), "columns": columns})
+
+def _decode_column(entry, values):
+    if entry.get("as_object"):
+        table = np.asarray(entry["categories"] + [np.nan], dtype=object)
+        return table[values]  # code -1 picks the trailing NaN
+    if entry["kind"] == "categorical":
+        return pd.Categorical.from_codes(values, categories=entry["categories"])
+    # The stored unit decides, so in memory only ms columns come back as int32
+    unit = entry.get("unit")
+    if unit == "ms":
+        return values if values.dtype == MILLIS_DTYPE else to_millis(to_seconds(values, "ms"))
+    if unit is not None and unit not in TIME_UNITS:
+        raise ValueError(f"Column {entry['name']!r} has unknown time unit {unit!r}")
+    if values.dtype == MILLIS_DTYPE and (unit == "s" or entry["name"] in TIME_COLUMNS):
+        return values.astype(np.float64)
+    return values
+
+def open_store(store_path):
+    """Opens a compiled store as a DataFrame backed by memory-mapped columns."""
+    meta = _read_meta(store_path)
+    data = {}
+    for entry in meta["columns"]:
+        values = np.load(os.path.join(store_path, entry["file"]), mmap_mode='r')
+        data[entry["name"]] = _decode_column(entry, values)
+    return pd.DataFrame(data, copy=False)
+
+def store_rows(store_path):
+    """Row count of a compiled store."""
+    return _read_meta(store_path)["rows"]
+
+def read_store_rows(store_path, start, stop, columns=None):
+    """
+    Reads rows [start, stop) of a compiled store into memory, optionally only the
+    named columns. Each column is mapped just for the copy, so pages read for
+    earlier ranges do not stay in the process's resident set.
+    """
+    data = {}
+    for entry in _read_meta(store_path)["columns"]:
+        if columns is not None and entry["name"] not in columns:
+            continue
+        mapped = np.load(os.path.join(store_path, entry["file"]), mmap_mode='r')
+        values = np.array(mapped[start:stop])
+        del mapped
+        data[entry["name"]] = _decode_column(entry, values)
+    return pd.DataFrame(data, copy=False)
+
+def _read_segments(store_path):
+    try:
+        with open(os.path.join(store_path, "segments.json"), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def _write_segments(store_path, segments):
+    tmp_path = os.path.join(store_path, "segments.json.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(segments, f, indent=1)
+    os.replace(tmp_path, os.path.join(store_path, "segments.json"))
+
+def segment_versions(store_path):
+    """Returns {key: version} for the segments of an append-only store."""
+    return {key: entry["version"] for key, entry in _read_segments(store_path).items()}
+
+def append_frames(store_path, frames):
+    """
+    Adds (key, version, df) items to an append-only store, one segment per key
+    (e.g. one film). Idempotent: a key already stored with the same version is
+    left alone, and a new version replaces the old segment. The segment manifest
+    is written once at the end. Returns the keys that were written.
+    """
+    segments = _read_segments(store_path)
+    written = []
+    replaced = []
+    try:
+        for key, version, df in frames:
+            current = segments.get(key)
+            if current is not None and current["version"] == version:
+                continue
+            
+            segment_dir = hashlib.sha256(f"{key}:{version}".encode()).hexdigest()[:16]
+            save_frame(df, os.path.join(store_path, "segments", segment_dir))
+            segments[key] = {"version": version, "dir": segment_dir, "rows": len(df)}
+            written.append(key)
+            if current is not None and current["dir"] != segment_dir:
+                replaced.append(current["dir"])
+    finally:
+        if written:
+            os.makedirs(store_path, exist_ok=True)
+            _write_segments(store_path, segments)
+    
+    # The manifest no longer points at replaced segments, so they can go
+    for segment_dir in replaced:
+        shutil.rmtree(os.path.join(store_path, "segments", segment_dir), ignore_errors=True)
+    return written
+
+def open_segments(store_path):
+    """Opens every segment of an append-only store as one DataFrame, in key order."""
+    segments = _read_segments(store_path)
+    frames = [open_store(os.path.join(store_path, "segments", segments[key]["dir"])) for key in sorted(segments)]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def store_path_for(csv_path, store_dir=STORE_DIR):
+    """Where the compiled store of csv_path lives (whether or not it is built)."""
+    return os.path.join(store_dir, os.path.splitext(os.path.basename(csv_path))[0])
+
+def _fresh_store_path(csv_path, store_dir):
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(csv_path)
+    
+    store_path = store_path_for(csv_path, store_dir)
+    if not is_fresh(csv_path, store_path):
+        print(f"Compiling {csv_path} into {store_path}...")
+        build_store(csv_path, store_path)
+    return store_path
+
+def load_csv(csv_path, store_dir=STORE_DIR):
+    """
+    Drop-in replacement for pd.read_csv on shot CSVs.
+    Serves the compiled store for csv_path, (re)building it first if it is missing
+    or the CSV has changed. Raises FileNotFoundError if the CSV does not exist.
+    """
+    return open_store(_fresh_store_path(csv_path, store_dir))
+
+def artifact_path(csv_path, name, store_dir=STORE_DIR):
+    """
+    Returns (path, version) for a derived file kept inside the store of csv_path.
+    version is the source CSV's sha256; callers record it with the file and
+    rebuild when it no longer matches. Rebuilding the store drops these files;
+    caches that should outlive it go under cache_path.
+    """
+    store_path = _fresh_store_path(csv_path, store_dir)
+    return os.path.join(store_path, name), _read_meta(store_path)["sha256"]
+
+def cache_path(csv_path, name, store_dir=STORE_DIR):
+    """
+    Where a content-addressed cache derived from csv_path lives. Unlike an
+    artifact_path file it sits outside the store, so it survives the store being
+    rebuilt; its entries must carry their own content hashes.
+    """
+    return os.path.join(store_dir, "cache", os.path.basename(store_path_for(csv_path, store_dir)), name)
+
+def source_version(csv_path, store_dir=STORE_DIR):
+    """
+    Returns the sha256 of the CSV the store of csv_path was compiled from, after
+    making sure the store is fresh. Cheap when the CSV is unchanged.
+    """
+    return _read_meta(_fresh_store_path(csv_path, store_dir))["sha256"]
+
+def store_sketch(store_path, column):
+    """Returns the quantile sketch compiled for a time or float column of a store."""
+    for entry in _read_meta(store_path)["columns"]:
+        if entry["name"] == column and "sketch" in entry:
+            return quantile_sketch.load_sketch(os.path.join(store_path, entry["sketch"]))
+    raise KeyError(f"No sketch for column {column!r} in {store_path}")
+
+def load_sketch(csv_path, column, store_dir=STORE_DIR):
+    """Returns the compiled quantile sketch of a float column of csv_path."""
+    return store_sketch(_fresh_store_path(csv_path, store_dir), column)
@@ -1,23 +1,76 @@
+import json
+import multiprocessing
+import os
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
+import shot_store
+import quantile_sketch
+import pace_grid
+import scene_stats
+import title_classifier
 
-def load_data():
-    """Loads and standardizes datasets."""
+def load_hero_data():
+    """Loads the Cinemetrics hero set alone (it is small enough to load whole in every mode)."""
     try:
-        hero_df = pd.read_csv("data/hero_movies_clean.csv")
+        return shot_store.load_csv("data/hero_movies_clean.csv")
     except FileNotFoundError:
-        hero_df = pd.DataFrame()
+        return pd.DataFrame()
+
+def load_data():
+    """
+    Loads and standardizes datasets. Time columns come back as int32 milliseconds
+    (see shot_store), including the hero set's start_time, which the CSV holds as
+    MM:SS.d timecode strings; decode them with shot_store.to_seconds.
+    """
+    hero_df = load_hero_data()
         
     try:
-        mb_df = pd.read_csv("data/moviebench_raw.csv")
+        mb_df = shot_store.load_csv("data/moviebench_raw.csv")
         # Ensure clean titles immediately
         if not mb_df.empty:
-            mb_df['clean_title'] = mb_df['movie_title'].apply(clean_mb_title)
+            mb_df['clean_title'] = clean_title_column(mb_df['movie_title'])
     except FileNotFoundError:
         mb_df = pd.DataFrame()
         
     return hero_df, mb_df
 
+# Title keywords per genre for the 'Fingerprint' plot. get_genre_data also accepts
+# a mapping or a rules file (see title_classifier.load_keyword_map).
+DEFAULT_GENRE_MAP = {
+    'Action': [
+        "Harry Potter", "Indiana Jones", "Vantage Point", "Quantum of Solace", 
+        "Men in black", "Spider-Man", "Iron Man", "Avatar", "Skyfall", 
+        "The Dark Knight", "Inception", "Matrix", "Star Wars", "Fast and Furious",
+        "Mission Impossible", "Hunger Games", "Transformers", "X-Men", "Avengers"
+    ],
+    'Comedy': [
+        "This is 40", "Yes man", "Identity Thief", "Horrible Bosses", 
+        "The Ugly Truth", "27 Dresses", "Marley and me", "Juno", 
+        "Crazy Stupid Love", "Chasing Amy", "Superbad", "Hangover", 
+        "Bridesmaids", "Knocked Up", "Step Brothers", "Anchorman"
+    ],
+    'Drama': [
+        "Gran Torino", "Benjamin Button", "Amadeus", "American Beauty", 
+        "Forrest Gump", "Gandhi", "Schindler", "Shawshank", "Godfather", 
+        "Pulp Fiction", "Fight Club", "Goodfellas", "Social Network", 
+        "Moonlight", "Parasite", "Nomadland", "Spotlight", "Birdman", 
+        "12 Years a Slave", "Argo", "Kings Speech", "Slumdog Millionaire"
+    ]
+}
+
+def load_duration_sketch():
+    """
+    Loads the ingest-time quantile sketch of MovieBench durations.
+    Returns None if the data is missing.
+    """
+    try:
+        return shot_store.load_sketch("data/moviebench_raw.csv", "duration")
+    except FileNotFoundError:
+        return None
+
 def clean_mb_title(t):
     """Helper to clean MovieBench titles."""
     parts = t.split('_', 1)
@@ -25,63 +78,230 @@ def clean_mb_title(t):
         return parts[1].replace('_', ' ')
     return t.replace('_', ' ')
 
-def get_global_stats(mb_df):
-    """Calculates global stats from MovieBench."""
+def clean_title_column(titles):
+    """
+    Applies clean_mb_title once per distinct title of a categorical column and
+    broadcasts the result back to every row through the category codes.
+    """
+    titles = titles.astype('category')
+    cleaned = [clean_mb_title(t) for t in titles.cat.categories]
+    uniques, inverse = np.unique(cleaned, return_inverse=True)
+    codes = titles.cat.codes.to_numpy()
+    # Missing titles keep code -1
+    clean_codes = np.where(codes >= 0, inverse[codes], -1)
+    return pd.Categorical.from_codes(clean_codes, categories=uniques)
+
+def build_movie_index(df, title_col='clean_title', duration_col='duration'):
+    """
+    Groups a shot frame by movie once so the stats functions can answer in O(movies).
+    Returns a dict of NumPy arrays:
+        titles            sorted distinct titles (movie i is titles[i])
+        codes             per-row movie number, -1 for rows without a title
+        order             row positions grouped by movie, original order within a movie
+        offsets           movie i owns order[offsets[i]:offsets[i + 1]]
+        counts            shots per movie
+        totals            summed duration per movie
+        cum_durations     running duration within each movie, aligned with order
+        sorted_durations  durations sorted within each movie's offsets range
+    """
+    codes, uniques = pd.factorize(df[title_col], sort=True) if len(df) else (np.array([], dtype=np.int64), [])
+    titles = np.asarray(uniques, dtype=object)
+    durations = shot_store.to_seconds(df[duration_col]) if len(df) else np.array([])
+    
+    rows = np.flatnonzero(codes >= 0)
+    order = rows[np.argsort(codes[rows], kind='stable')]
+    counts = np.bincount(codes[rows], minlength=len(titles))
+    offsets = np.zeros(len(titles) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    
+    grouped = durations[order]
+    movie_of_row = np.repeat(np.arange(len(titles)), counts)
+    # Summed movie by movie, so it matches np.cumsum over a single film's shots exactly
+    cum_durations = pd.Series(grouped).groupby(movie_of_row, sort=False).cumsum().to_numpy()
+    totals = np.add.reduceat(grouped, offsets[:-1]) if len(grouped) else np.zeros(len(titles))
+    
+    sorted_durations = grouped[np.lexsort((grouped, movie_of_row))]
+    
+    return {
+        "titles": titles,
+        "codes": codes,
+        "order": order,
+        "offsets": offsets,
+        "counts": counts,
+        "totals": totals,
+        "cum_durations": cum_durations,
+        "sorted_durations": sorted_durations,
+        "n_rows": len(df)
+    }
+
+_INDEX_CACHE = {}
+FINGERPRINT_SAMPLES = 64
+
+def _column_fingerprint(column):
+    # Where the column's values live plus a strided sample of them: reassigning the
+    # column moves the buffer, and in-place edits of a sampled row change the hash
+    values = column.array
+    values = np.asarray(values.codes if isinstance(values, pd.Categorical) else values)
+    step = max(1, len(values) // FINGERPRINT_SAMPLES)
+    return (values.__array_interface__['data'][0], len(values),
+            pd.util.hash_array(values[::step]).tobytes())
+
+def get_movie_index(df, title_col='clean_title', duration_col='duration'):
+    """
+    Returns the cached movie index for df, building it on first use. Frames are
+    treated as read-only once indexed: the cache checks a cheap fingerprint of the
+    two columns, but an in-place edit between sampled rows goes unseen, so code
+    that mutates an indexed frame calls invalidate_movie_index(df).
+    """
+    key = (id(df), title_col, duration_col)
+    fingerprint = (_column_fingerprint(df[title_col]), _column_fingerprint(df[duration_col])) if len(df) else None
+    cached = _INDEX_CACHE.get(key)
+    if cached is not None and cached[0]() is df and cached[1] == fingerprint:
+        return cached[2]
+    
+    index = build_movie_index(df, title_col, duration_col)
+    _INDEX_CACHE[key] = (weakref.ref(df, lambda _: _INDEX_CACHE.pop(key, None)), fingerprint, index)
+    return index
+
+def invalidate_movie_index(df):
+    """Drops every cached movie index of df (call after editing it in place)."""
+    for key in [key for key in _INDEX_CACHE if key[0] == id(df)]:
+        del _INDEX_CACHE[key]
+
+def movie_medians(index):
+    """Per-movie median duration, read straight off the sorted durations."""
+    starts = index['offsets'][:-1]
+    counts = index['counts']
+    lo = index['sorted_durations'][starts + (counts - 1) // 2]
+    hi = index['sorted_durations'][starts + counts // 2]
+    return (lo + hi) / 2
+
+# Least recently used first; ad-hoc title queries each add rules, so the cache is bounded
+_LABEL_CACHE = OrderedDict()
+LABEL_CACHE_SIZE = 256
+
+def classify_movies(index, keyword_map, case=False):
+    """
+    Labels every distinct title in the index (or a movie summary) against {label: [keywords]}.
+    Returns (labels, matrix) with matrix[movie, label]; the last LABEL_CACHE_SIZE
+    results are cached per titles array so repeated queries with the same rules
+    are free. The cache lives outside the index and summary, which stay plain
+    dicts of per-movie arrays.
+    """
+    titles = index['titles']
+    key = (id(titles), json.dumps(keyword_map, sort_keys=True), case)
+    cached = _LABEL_CACHE.get(key)
+    if cached is not None and cached[0]() is titles:
+        _LABEL_CACHE.move_to_end(key)
+        return cached[1]
+    
+    labels = title_classifier.classify_titles(titles, keyword_map, case)
+    _LABEL_CACHE[key] = (weakref.ref(titles, lambda _: _LABEL_CACHE.pop(key, None)), labels)
+    if len(_LABEL_CACHE) > LABEL_CACHE_SIZE:
+        _LABEL_CACHE.popitem(last=False)
+    return labels
+
+def keyword_mask(index, keywords, case=False):
+    """Boolean mask over index['titles'] for titles containing any of keywords."""
+    _, matrix = classify_movies(index, {"match": list(keywords)}, case)
+    return matrix[:, 0]
+
+def rows_for_movies(index, movie_mask):
+    """Broadcasts a per-movie mask to a per-row mask via the movie codes."""
+    # Appending False makes code -1 (no title) select nothing
+    return np.append(movie_mask, False)[index['codes']]
+
+def get_global_stats(mb_df, sketch=None):
+    """
+    Calculates global stats from MovieBench.
+    With a sketch the quantiles are within quantile_sketch.RELATIVE_ACCURACY of the
+    exact values and never touch the raw durations.
+    """
+    if sketch is not None:
+        if sketch['count'] == 0:
+            return {}
+        median, p95 = quantile_sketch.sketch_quantile(sketch, [0.5, 0.95])
+        return {
+            "median": median,
+            "p95": p95,
+            "std_dev": quantile_sketch.sketch_std(sketch),
+            "count": sketch['count']
+        }
+    
     if mb_df.empty:
         return {}
     
+    durations = pd.Series(shot_store.to_seconds(mb_df['duration']))
     return {
-        "median": mb_df['duration'].median(),
-        "p95": mb_df['duration'].quantile(0.95),
-        "std_dev": mb_df['duration'].std(),
+        "median": durations.median(),
+        "p95": durations.quantile(0.95),
+        "std_dev": durations.std(),
         "count": len(mb_df)
     }
 
-def get_reid_frequency(mb_df):
+# The per-movie arrays of a movie summary, all aligned on 'titles'
+SUMMARY_FIELDS = ("titles", "counts", "totals", "medians")
+
+def movie_summary(index):
     """
-    Insight A: Re-ID Frequency
-    Calculates average Cuts Per Minute.
+    Per-movie aggregates (titles, counts, totals, medians) that every headline stat
+    is reduced from. Summaries of disjoint movie sets can be concatenated, which is
+    what the sharded path does.
     """
-    if mb_df.empty:
+    if 'summary' not in index:
+        index['summary'] = {
+            "titles": index['titles'],
+            "counts": index['counts'],
+            "totals": index['totals'],
+            "medians": movie_medians(index)
+        }
+    return index['summary']
+
+def reid_frequency_from_summary(summary):
+    if len(summary['counts']) == 0:
         return 0
     
-    # Calculate per movie to avoid skewing by total dataset length
-    movie_stats = mb_df.groupby('clean_title')['duration'].sum().reset_index()
-    movie_stats['minutes'] = movie_stats['duration'] / 60
-    movie_stats['shot_count'] = mb_df.groupby('clean_title')['duration'].count().values
+    minutes = summary['totals'] / 60
     
     # Filter out tiny snippets (trailers/clips < 5 mins)
-    valid_movies = movie_stats[movie_stats['minutes'] > 5]
+    valid = minutes > 5
     
-    if valid_movies.empty:
+    if not valid.any():
         return 0
         
-    avg_cpm = (valid_movies['shot_count'] / valid_movies['minutes']).median()
+    avg_cpm = np.median(summary['counts'][valid] / minutes[valid])
     return avg_cpm
 
-def get_editorial_bpm(mb_df, hero_df):
+def get_reid_frequency(mb_df):
     """
-    Insight C: Editorial BPM (Beats Per Minute)
-    Comparison of Mad Max vs Godfather vs AI
+    Insight A: Re-ID Frequency
+    Calculates average Cuts Per Minute.
     """
+    if mb_df.empty:
+        return 0
+    
+    # Calculate per movie to avoid skewing by total dataset length
+    return reid_frequency_from_summary(movie_summary(get_movie_index(mb_df)))
+
+def editorial_bpm_from_summaries(mb_summary, hero_summary):
     # 1. Mad Max (Hero)
-    mad_max = hero_df[hero_df['movie_title'].str.contains("Mad Max", case=False)]
-    if not mad_max.empty:
-        mm_bpm = len(mad_max) / (mad_max['shot_length_sec'].sum() / 60)
+    mad_max = keyword_mask(hero_summary, ["Mad Max"])
+    if mad_max.any():
+        mm_bpm = hero_summary['counts'][mad_max].sum() / (hero_summary['totals'][mad_max].sum() / 60)
     else:
         mm_bpm = 22.0 # Fallback based on known stats if data missing
         
     # 2. The Godfather (MB)
-    godfather = mb_df[mb_df['clean_title'].str.contains("Godfather", case=False)]
-    if not godfather.empty:
+    godfather = keyword_mask(mb_summary, ["Godfather"])
+    if godfather.any():
         # Calculate BPM
-        duration_min = godfather['duration'].sum() / 60
-        gf_bpm = len(godfather) / duration_min
+        duration_min = mb_summary['totals'][godfather].sum() / 60
+        gf_bpm = mb_summary['counts'][godfather].sum() / duration_min
     else:
         gf_bpm = 8.0 # Fallback
         
     # 3. Average Cinema (MB)
-    avg_bpm = get_reid_frequency(mb_df)
+    avg_bpm = reid_frequency_from_summary(mb_summary)
     
     return {
         "Mad Max: Fury Road": mm_bpm,
@@ -90,50 +310,74 @@ def get_editorial_bpm(mb_df, hero_df):
         "Current AI Demos": 1.0 # Theoretical baseline (60s shots)
     }
 
-def get_wasteland_stat(mb_df):
+def get_editorial_bpm(mb_df, hero_df):
+    """
+    Insight C: Editorial BPM (Beats Per Minute)
+    Comparison of Mad Max vs Godfather vs AI
+    """
+    hero_summary = movie_summary(get_movie_index(hero_df, 'movie_title', 'shot_length_sec'))
+    return editorial_bpm_from_summaries(movie_summary(get_movie_index(mb_df)), hero_summary)
+
+def in_wasteland(durations):
+    """Mask of durations inside the 10-30s band."""
+    return (durations >= 10) & (durations <= 30)
+
+def wasteland_pct_from_counts(wasteland_count, total_count):
+    if total_count == 0:
+        return 0
+    return (wasteland_count / total_count) * 100
+
+def get_wasteland_stat(mb_df, sketch=None):
     """
     Insight B: The '10-Second Wasteland'
     % of shots between 10s and 30s.
     """
+    if sketch is not None:
+        if sketch['count'] == 0:
+            return 0
+        return quantile_sketch.sketch_share_between(sketch, 10, 30) * 100
+    
     if mb_df.empty:
         return 0
         
-    wasteland_count = mb_df[(mb_df['duration'] >= 10) & (mb_df['duration'] <= 30)].shape[0]
-    total_count = len(mb_df)
-    
-    return (wasteland_count / total_count) * 100
+    wasteland_count = int(in_wasteland(shot_store.to_seconds(mb_df['duration'])).sum())
+    return wasteland_pct_from_counts(wasteland_count, len(mb_df))
 
-def get_blockbuster_stats(mb_df, hero_df):
-    """
-    Extracts stats for specific blockbusters from both datasets for the Scatter Plot.
-    """
+# Notable MovieBench movies for the blockbuster scatter (plus any Harry Potter / Spider-Man)
+NOTABLE_TITLES = [
+    "Harry Potter and the order of phoenix", 
+    "Harry Potter and the Half-Blood Prince",
+    "Indiana Jones and the last crusade",
+    "Gran Torino", 
+    "Identity Thief", 
+    "Vantage Point", 
+    "Quantum of Solace", 
+    "Spider-Man2",
+    "TITANIC",
+    "Iron Man",
+    "Avatar",
+    "Skyfall"
+]
+
+def blockbuster_stats_from_summaries(mb_summary, hero_summary):
     # 1. Hero Movies
-    hero_stats = hero_df.groupby('movie_title')['shot_length_sec'].median().reset_index()
-    hero_stats.columns = ['title', 'median_shot']
+    hero_stats = pd.DataFrame({'title': hero_summary['titles'], 'median_shot': hero_summary['medians']})
     
     # 2. Notable MovieBench Movies
-    notable_list = [
-        "Harry Potter and the order of phoenix", 
-        "Harry Potter and the Half-Blood Prince",
-        "Indiana Jones and the last crusade",
-        "Gran Torino", 
-        "Identity Thief", 
-        "Vantage Point", 
-        "Quantum of Solace", 
-        "Spider-Man2",
-        "TITANIC",
-        "Iron Man",
-        "Avatar",
-        "Skyfall"
-    ]
-    
-    mb_stats = mb_df[mb_df['clean_title'].isin(notable_list) | mb_df['clean_title'].str.contains("Harry Potter") | mb_df['clean_title'].str.contains("Spider-Man")].groupby('clean_title')['duration'].median().reset_index()
-    mb_stats.columns = ['title', 'median_shot']
+    notable = np.isin(mb_summary['titles'], NOTABLE_TITLES) | keyword_mask(mb_summary, ["Harry Potter", "Spider-Man"], case=True)
+    mb_stats = pd.DataFrame({'title': mb_summary['titles'][notable], 'median_shot': mb_summary['medians'][notable]})
     
     # Combine
     combined = pd.concat([hero_stats, mb_stats]).drop_duplicates(subset='title')
     return combined.sort_values('median_shot')
 
+def get_blockbuster_stats(mb_df, hero_df):
+    """
+    Extracts stats for specific blockbusters from both datasets for the Scatter Plot.
+    """
+    hero_summary = movie_summary(get_movie_index(hero_df, 'movie_title', 'shot_length_sec'))
+    return blockbuster_stats_from_summaries(movie_summary(get_movie_index(mb_df)), hero_summary)
+
 def get_bourne_data(hero_df):
     """Returns just the Bourne Ultimatum shots."""
     return hero_df[hero_df['movie_title'] == "The Bourne Ultimatum"].copy()
@@ -141,44 +385,106 @@ def get_bourne_data(hero_df):
 def get_heatmap_data(mb_df):
     """
     Prepares data for Heatmap of Pace.
+    Uses the shots' recorded start times when mb_df has them (see
+    fetch_moviebench.SHOT_COLUMNS); otherwise shots are taken to run back to back
+    in row order and start times are rebuilt from running sums.
     """
+    index = get_movie_index(mb_df)
+    order = index['order']
+    
+    shot_idx = np.zeros(len(mb_df), dtype=np.int64)
+    shot_idx[order] = np.arange(len(order)) - np.repeat(index['offsets'][:-1], index['counts'])
+    
     df = mb_df.copy()
-    df['shot_idx'] = df.groupby('clean_title').cumcount()
-    df['end_time'] = df.groupby('clean_title')['duration'].cumsum()
-    df['start_time_min'] = (df['end_time'] - df['duration']) / 60.0
+    df['shot_idx'] = shot_idx
+    if 'start_time' in mb_df:
+        df['start_time_min'] = shot_store.to_seconds(mb_df['start_time']) / 60.0
+        return df
+    
+    end_time = np.full(len(mb_df), np.nan)
+    end_time[order] = index['cum_durations']
+    df['end_time'] = end_time
+    df['start_time_min'] = (df['end_time'] - shot_store.to_seconds(df['duration'])) / 60.0
     return df
 
-def get_genre_data(mb_df):
+def build_pace_grid(mb_df):
     """
-    Returns a subset of data labeled with genres for the 'Fingerprint' plot.
+    Bins every shot of the Heatmap of Pace into a pace_grid, equivalent to calling
+    pace_grid.add_movie once per film (with the recorded start times when mb_df
+    has a start_time column).
     """
-    genre_map = {
-        'Action': [
-            "Harry Potter", "Indiana Jones", "Vantage Point", "Quantum of Solace", 
-            "Men in black", "Spider-Man", "Iron Man", "Avatar", "Skyfall", 
-            "The Dark Knight", "Inception", "Matrix", "Star Wars", "Fast and Furious",
-            "Mission Impossible", "Hunger Games", "Transformers", "X-Men", "Avengers"
-        ],
-        'Comedy': [
-            "This is 40", "Yes man", "Identity Thief", "Horrible Bosses", 
-            "The Ugly Truth", "27 Dresses", "Marley and me", "Juno", 
-            "Crazy Stupid Love", "Chasing Amy", "Superbad", "Hangover", 
-            "Bridesmaids", "Knocked Up", "Step Brothers", "Anchorman"
-        ],
-        'Drama': [
-            "Gran Torino", "Benjamin Button", "Amadeus", "American Beauty", 
-            "Forrest Gump", "Gandhi", "Schindler", "Shawshank", "Godfather", 
-            "Pulp Fiction", "Fight Club", "Goodfellas", "Social Network", 
-            "Moonlight", "Parasite", "Nomadland", "Spotlight", "Birdman", 
-            "12 Years a Slave", "Argo", "Kings Speech", "Slumdog Millionaire"
-        ]
-    }
+    index = get_movie_index(mb_df)
+    durations = shot_store.to_seconds(mb_df['duration'])[index['order']]
+    if 'start_time' in mb_df:
+        start_times = shot_store.to_seconds(mb_df['start_time'])[index['order']]
+    else:
+        start_times = index['cum_durations'] - durations
+    grid = pace_grid.new_pace_grid()
+    pace_grid.add_points(grid, start_times / 60.0, durations)
+    grid['n_movies'] = len(index['titles'])
+    return grid
+
+def load_pace_grid(mb_df, csv_path="data/moviebench_raw.csv"):
+    """
+    Returns the pace grid kept next to the compiled store of csv_path, building it
+    from mb_df when it is missing or was built from a different version of the CSV.
+    """
+    try:
+        grid_path, version = shot_store.artifact_path(csv_path, "pace_grid.npz")
+    except FileNotFoundError:
+        return build_pace_grid(mb_df)
+
+    if os.path.exists(grid_path):
+        grid = pace_grid.load_pace_grid(grid_path)
+        if grid.pop('source_sha256', None) == version:
+            return grid
+
+    grid = build_pace_grid(mb_df)
+    pace_grid.save_pace_grid(grid, grid_path, source_sha256=version)
+    return grid
+
+SCENE_COLUMNS = ('scene_id', 'start_time', 'duration')
+
+def get_scene_stats(mb_df):
+    """
+    Scene-level aggregates (see scene_stats) from one pass over mb_df, or None
+    when it has no scene IDs and start times (older fetch output).
+    """
+    if mb_df.empty or not all(col in mb_df for col in SCENE_COLUMNS):
+        return None
+    titles = mb_df['clean_title'] if 'clean_title' in mb_df else mb_df['movie_title']
+    has_title = titles.notna().to_numpy()
+    agg = scene_stats.new_scene_stats()
+    return scene_stats.add_shots(agg, titles.to_numpy()[has_title], mb_df['scene_id'].to_numpy()[has_title],
+                                 shot_store.to_seconds(mb_df['start_time'])[has_title],
+                                 shot_store.to_seconds(mb_df['duration'])[has_title])
+
+def _classify_genres(index, genre_map):
+    # Resolves genre_map as get_genre_data documents it and labels the index's titles
+    if genre_map is None:
+        return classify_movies(index, DEFAULT_GENRE_MAP)
+    if not isinstance(genre_map, str):
+        return classify_movies(index, genre_map)
     
+    genres, matrix = classify_movies(index, title_classifier.load_keyword_map(genre_map))
+    if len(index['titles']) and not matrix.any():
+        raise ValueError(f"Genre rules in {genre_map} match none of the {len(index['titles'])} titles")
+    return genres, matrix
+
+def get_genre_data(mb_df, genre_map=None):
+    """
+    Returns a subset of data labeled with genres for the 'Fingerprint' plot.
+    genre_map is {genre: [title keywords]} or a path to a rules file (see
+    title_classifier.load_keyword_map); defaults to DEFAULT_GENRE_MAP. Rules from a
+    file that match no title raise ValueError. Titles are classified once each and
+    the labels broadcast to shots through the movie codes.
+    """
     labeled_dfs = []
+    index = get_movie_index(mb_df)
+    genres, matrix = _classify_genres(index, genre_map)
     
-    for genre, keywords in genre_map.items():
-        pattern = '|'.join(keywords)
-        mask = mb_df['clean_title'].str.contains(pattern, case=False, regex=True)
+    for col, genre in enumerate(genres):
+        mask = rows_for_movies(index, matrix[:, col])
         subset = mb_df[mask].copy()
         subset['genre'] = genre
         labeled_dfs.append(subset)
@@ -188,17 +494,261 @@ def get_genre_data(mb_df):
         
     return pd.concat(labeled_dfs)
 
+def get_genre_sketches(mb_df, genre_map=None):
+    """
+    Per-genre duration sketches for drawing the 'Fingerprint' densities without the
+    labelled shots (see quantile_sketch.sketch_kde). Same genre_map handling as
+    get_genre_data; genres with no shots are left out.
+    """
+    index = get_movie_index(mb_df)
+    genres, matrix = _classify_genres(index, genre_map)
+    durations = shot_store.to_seconds(mb_df['duration'])
+    
+    sketches = {}
+    for col, genre in enumerate(genres):
+        mask = rows_for_movies(index, matrix[:, col])
+        if mask.any():
+            sketches[genre] = quantile_sketch.sketch_from_values(durations[mask])
+    return sketches
+
+def coverage_bin_counts(durations, thresholds):
+    """
+    Shot counts per threshold bin (mergeable by summing). Bin k holds shots in
+    (t[k-1], t[k]] of the sorted thresholds; the last bin is everything longer.
+    """
+    sorted_thresholds = np.sort(np.asarray(thresholds, dtype=np.float64), kind='stable')
+    bins = np.searchsorted(sorted_thresholds, np.asarray(durations, dtype=np.float64), side='left')
+    return np.bincount(bins, minlength=len(sorted_thresholds) + 1)
+
+def coverage_curve_from_counts(bin_counts, thresholds, total):
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    order = np.argsort(thresholds, kind='stable')
+    percent = np.empty(len(thresholds))
+    percent[order] = np.cumsum(bin_counts[:-1]) / total * 100
+    return pd.DataFrame({'duration': thresholds, 'percent_covered': percent})
+
+def get_coverage_curve(df, thresholds=None, max_clip=60, n_points=120, by=None, duration_col='duration'):
+    """
+    % of shots no longer than each candidate clip length.
+    Every shot is binned against the sorted thresholds once, so any number of
+    thresholds costs one O(shots * log thresholds) pass plus a cumulative sum.
+    thresholds defaults to n_points evenly spaced lengths in [0, max_clip].
+    With `by` (a column name such as 'clean_title' or 'genre') the curve is
+    computed per group and returned in long form with that column added.
+    """
+    if thresholds is None:
+        thresholds = np.linspace(0, max_clip, n_points)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    if len(df) == 0:
+        return pd.DataFrame()
+    
+    if by is None:
+        bin_counts = coverage_bin_counts(shot_store.to_seconds(df[duration_col]), thresholds)
+        return coverage_curve_from_counts(bin_counts, thresholds, len(df))
+    
+    # Bin k holds shots in (t[k-1], t[k]], so cumulative bin counts give count(duration <= t[k])
+    order = np.argsort(thresholds, kind='stable')
+    bins = np.searchsorted(thresholds[order], shot_store.to_seconds(df[duration_col]), side='left')
+    n_bins = len(thresholds) + 1
+    
+    codes, groups = pd.factorize(df[by], sort=True)
+    keep = codes >= 0
+    grid = np.bincount(codes[keep] * n_bins + bins[keep], minlength=len(groups) * n_bins)
+    grid = grid.reshape(len(groups), n_bins)
+    covered = np.cumsum(grid[:, :-1], axis=1)
+    totals = grid.sum(axis=1, keepdims=True)
+    percent = np.empty_like(covered, dtype=np.float64)
+    percent[:, order] = covered / totals * 100
+    
+    return pd.DataFrame({
+        by: np.repeat(np.asarray(groups, dtype=object), len(thresholds)),
+        'duration': np.tile(thresholds, len(groups)),
+        'percent_covered': percent.ravel()
+    })
+
 def get_cost_consistency_data(mb_df):
     """
     Calculates the 'Cost of Consistency' curve data.
     """
-    durations = np.linspace(0, 60, 120) 
-    percentages = []
-    total = len(mb_df)
-    if total == 0:
-        return pd.DataFrame()
-    for d in durations:
-        count = len(mb_df[mb_df['duration'] <= d])
-        percentages.append(count / total * 100)
-        
-    return pd.DataFrame({'duration': durations, 'percent_covered': percentages})
+    return get_coverage_curve(mb_df)
+
+def stats_from_partials(merged, mb_df, hero_df, thresholds, sketch=None):
+    """
+    Builds the headline stats from merged per-movie partials (see sharded and
+    incremental). Global stats still come from the sketch, or the full column
+    when there is none, and the small hero set is summarised in-process.
+    Includes the coverage curve and pace grid for the figures.
+    """
+    mb_summary = merged['summary']
+    hero_summary = movie_summary(get_movie_index(hero_df, 'movie_title', 'shot_length_sec'))
+    
+    if sketch is not None:
+        wasteland_pct = get_wasteland_stat(mb_df, sketch=sketch)
+    else:
+        wasteland_pct = wasteland_pct_from_counts(merged['wasteland_count'], merged['total'])
+    
+    return {
+        "global_stats": get_global_stats(mb_df, sketch=sketch),
+        "reid_frequency": reid_frequency_from_summary(mb_summary),
+        "wasteland_pct": wasteland_pct,
+        "editorial_bpm": editorial_bpm_from_summaries(mb_summary, hero_summary),
+        "blockbusters": blockbuster_stats_from_summaries(mb_summary, hero_summary),
+        "coverage": coverage_curve_from_counts(merged['coverage_counts'], thresholds, merged['total']),
+        "pace_grid": merged['pace_grid']
+    }
+
+# Movie-level cluster bootstrap. A replicate draws len(movies) films with
+# replacement and recomputes every headline stat over all shots of the drawn films,
+# so films with thousands of shots carry one film's worth of uncertainty. Draws
+# are turned into per-movie weights, which replace looping over resampled frames:
+# sums and counts come from weights @ per-movie totals, and pooled quantiles from
+# the globally sorted shots, cut into blocks. Per-movie block counts locate the
+# block holding a rank with one matrix product and only that block's shots are
+# scanned, so a replicate costs O(movies * blocks + block length) instead of
+# O(shots). Blocks of sqrt(shots * movies / 256) balance the two terms, since a
+# matrix-product cell is far cheaper than a gathered, scanned shot.
+BOOTSTRAP_METRICS = ("median", "p95", "std_dev", "reid_frequency", "wasteland_pct")
+BOOTSTRAP_PART = 500
+BOOTSTRAP_BATCH_CELLS = 1 << 22
+
+def _sorted_sample(values, movies, n_movies):
+    # values with the movie each belongs to, sorted, plus per-movie counts per block
+    order = np.argsort(values, kind='stable')
+    block_len = max(1, int(np.ceil(np.sqrt(len(values) * n_movies / 256))))
+    n_blocks = max(1, -(-len(values) // block_len))
+    block_counts = np.bincount(movies[order] * n_blocks + np.arange(len(values)) // block_len,
+                               minlength=n_movies * n_blocks).reshape(n_movies, n_blocks)
+    return {
+        "values": values[order],
+        "movies": movies[order],
+        "block_len": block_len,
+        "block_counts": block_counts.astype(np.float64)
+    }
+
+def bootstrap_inputs(mb_df):
+    """Per-movie arrays the bootstrap replicates are computed from."""
+    index = get_movie_index(mb_df)
+    counts = index['counts']
+    starts = index['offsets'][:-1]
+    shots = index['sorted_durations']
+    movie_of_shot = np.repeat(np.arange(len(counts)), counts)
+    # Sums of squares are taken around the pooled mean to keep the variance well conditioned
+    shift = shots.mean()
+    minutes = index['totals'] / 60
+    valid = np.flatnonzero(minutes > 5)
+    return {
+        "shots": _sorted_sample(shots, movie_of_shot, len(counts)),
+        "cpm": _sorted_sample(counts[valid] / minutes[valid], valid, len(counts)),
+        "counts": counts,
+        "sums": np.add.reduceat(shots - shift, starts),
+        "sumsqs": np.add.reduceat((shots - shift) ** 2, starts),
+        "wasteland": np.add.reduceat(in_wasteland(shots).astype(np.int64), starts)
+    }
+
+def _weighted_quantiles(sample, weights, qs):
+    """
+    Quantiles of each row's resample, where row b holds weights[b, m] copies of
+    every value of movie m. Interpolates linearly like np.quantile on the expanded
+    sample; rows with no weight give NaN.
+    """
+    values, movies, block_len = sample['values'], sample['movies'], sample['block_len']
+    rows = np.arange(len(weights))
+    block_cum = np.rint(np.cumsum(weights @ sample['block_counts'], axis=1)).astype(np.int64)
+    totals = block_cum[:, -1]
+    offsets = np.arange(block_len)
+
+    def value_at(rank):
+        # Block holding the rank-th value, then the position inside it
+        block = (block_cum <= rank[:, None]).sum(axis=1)
+        block = np.minimum(block, block_cum.shape[1] - 1)
+        before = np.where(block > 0, block_cum[rows, block - 1], 0)
+        positions = block[:, None] * block_len + offsets
+        inside = positions < len(values)
+        positions = np.minimum(positions, len(values) - 1)
+        cum = np.cumsum(np.where(inside, weights[rows[:, None], movies[positions]], 0), axis=1)
+        j = (cum <= (rank - before)[:, None]).sum(axis=1)
+        return values[np.minimum(block * block_len + j, len(values) - 1)]
+
+    results = []
+    for q in qs:
+        if len(values) == 0:
+            results.append(np.full(len(weights), np.nan))
+            continue
+        h = np.maximum(totals - 1, 0) * q
+        lo = np.floor(h).astype(np.int64)
+        hi = np.minimum(lo + 1, np.maximum(totals - 1, 0))
+        v_lo = value_at(lo)
+        result = v_lo + (value_at(hi) - v_lo) * (h - lo)
+        results.append(np.where(totals > 0, result, np.nan))
+    return results
+
+def replicate_metrics(inputs, weights):
+    """Headline stats for each row of per-movie weights (draw counts)."""
+    n = weights @ inputs['counts']
+    median, p95 = _weighted_quantiles(inputs['shots'], weights, [0.5, 0.95])
+    s1 = weights @ inputs['sums']
+    s2 = weights @ inputs['sumsqs']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std_dev = np.sqrt(np.maximum(s2 - s1 ** 2 / n, 0) / (n - 1))
+    reid, = _weighted_quantiles(inputs['cpm'], weights, [0.5])
+    return {
+        "median": median,
+        "p95": p95,
+        "std_dev": std_dev,
+        "reid_frequency": reid,
+        "wasteland_pct": (weights @ inputs['wasteland']) / n * 100
+    }
+
+def bootstrap_replicates(inputs, n_replicates, seed, batch_cells=BOOTSTRAP_BATCH_CELLS):
+    """
+    Worker: n_replicates movie-level resamples, drawn in batches of index arrays
+    sized so a batch's largest matrix stays near batch_cells entries.
+    """
+    rng = np.random.default_rng(seed)
+    n_movies = len(inputs['counts'])
+    widest = max(n_movies, *(s['block_counts'].shape[1] + s['block_len'] for s in (inputs['shots'], inputs['cpm'])))
+    batch = max(1, batch_cells // widest)
+    replicates = {metric: [] for metric in BOOTSTRAP_METRICS}
+    for done in range(0, n_replicates, batch):
+        rows = min(batch, n_replicates - done)
+        draws = rng.integers(0, n_movies, size=(rows, n_movies))
+        draws += np.arange(rows)[:, None] * n_movies
+        weights = np.bincount(draws.ravel(), minlength=rows * n_movies).reshape(rows, n_movies)
+        for metric, values in replicate_metrics(inputs, weights).items():
+            replicates[metric].append(values)
+    return {metric: np.concatenate(values) for metric, values in replicates.items()}
+
+def get_bootstrap_cis(mb_df, n_replicates=10000, confidence=0.95, workers=None, seed=0):
+    """
+    Percentile confidence intervals for the headline stats from a movie-level
+    cluster bootstrap. Returns {metric: {'exact', 'low', 'high'}}: 'exact' is the
+    stat computed exactly over the full data, the estimator the replicates use,
+    so it can differ slightly from a sketch-based headline value. Replicates are
+    split into fixed parts with their own seeds and spread over `workers`
+    processes (1 runs in-process), so results depend on seed but not on the
+    worker count.
+    """
+    if mb_df.empty:
+        return {}
+    inputs = bootstrap_inputs(mb_df)
+    estimates = replicate_metrics(inputs, np.ones((1, len(inputs['counts'])), dtype=np.int64))
+
+    sizes = [min(BOOTSTRAP_PART, n_replicates - start) for start in range(0, n_replicates, BOOTSTRAP_PART)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    workers = min(workers or os.cpu_count() or 1, len(sizes))
+    if workers <= 1:
+        parts = [bootstrap_replicates(inputs, size, part_seed) for size, part_seed in zip(sizes, seeds)]
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            parts = list(pool.map(bootstrap_replicates, [inputs] * len(sizes), sizes, seeds))
+
+    alpha = (1 - confidence) / 2 * 100
+    cis = {}
+    for metric in BOOTSTRAP_METRICS:
+        replicates = np.concatenate([part[metric] for part in parts])
+        # Replicates with nothing to measure (e.g. no film over 5 minutes drawn) are left out
+        replicates = replicates[~np.isnan(replicates)]
+        low, high = np.percentile(replicates, [alpha, 100 - alpha]) if len(replicates) else (np.nan, np.nan)
+        cis[metric] = {"exact": float(estimates[metric][0]), "low": float(low), "high": float(high)}
+    return cis
@@ -0,0 +1,95 @@
+import json
+import os
+from collections import deque
+import numpy as np
+import pandas as pd
+
+# Keyword -> label classification of movie titles with an Aho-Corasick automaton.
+# Each distinct title is scanned once for all keywords of all labels, so classifying
+# thousands of titles against hundreds of rules stays linear in total title length.
+
+def build_automaton(keyword_map, case=False):
+    """
+    Compiles {label: [keywords]} into an automaton.
+    Matching is plain substring matching; case=False lowercases both sides.
+    """
+    labels = list(keyword_map)
+    goto = [{}]
+    outputs = [set()]
+
+    for label_idx, label in enumerate(labels):
+        for keyword in keyword_map[label]:
+            keyword = keyword if case else keyword.lower()
+            state = 0
+            for ch in keyword:
+                if ch not in goto[state]:
+                    goto[state][ch] = len(goto)
+                    goto.append({})
+                    outputs.append(set())
+                state = goto[state][ch]
+            outputs[state].add(label_idx)
+
+    # Breadth-first failure links; outputs inherit their fallback's outputs
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for ch, nxt in goto[state].items():
+            queue.append(nxt)
+            fallback = fail[state]
+            while fallback and ch not in goto[fallback]:
+                fallback = fail[fallback]
+            fail[nxt] = goto[fallback].get(ch, 0)
+            outputs[nxt] |= outputs[fail[nxt]]
+
+    return {"labels": labels, "goto": goto, "fail": fail, "outputs": outputs, "case": case}
+
+def match_labels(automaton, text):
+    """Returns the set of label indices whose keywords occur in text."""
+    goto, fail, outputs = automaton['goto'], automaton['fail'], automaton['outputs']
+    if not automaton['case']:
+        text = text.lower()
+
+    found = set()
+    state = 0
+    for ch in text:
+        while state and ch not in goto[state]:
+            state = fail[state]
+        state = goto[state].get(ch, 0)
+        if outputs[state]:
+            found |= outputs[state]
+    return found
+
+def classify_titles(titles, keyword_map, case=False):
+    """
+    Classifies distinct titles. Returns (labels, matrix) where matrix[i, j] is
+    True when titles[i] contains any keyword of labels[j].
+    """
+    automaton = build_automaton(keyword_map, case)
+    matrix = np.zeros((len(titles), len(automaton['labels'])), dtype=bool)
+    for i, title in enumerate(titles):
+        if isinstance(title, str):
+            for label_idx in match_labels(automaton, title):
+                matrix[i, label_idx] = True
+    return automaton['labels'], matrix
+
+def load_keyword_map(path):
+    """
+    Loads {label: [keywords]} rules from config.
+    JSON files hold the mapping directly. CSV files need a 'genre' column and a
+    'keyword' column of title substrings, one rule per row.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+
+    if path.endswith('.json'):
+        with open(path, 'r') as f:
+            return {label: list(keywords) for label, keywords in json.load(f).items()}
+
+    rules = pd.read_csv(path)
+    missing = [c for c in ('genre', 'keyword') if c not in rules.columns]
+    if missing:
+        raise ValueError(f"{path} needs 'genre' and 'keyword' columns (missing {missing})")
+
+    rules = rules.dropna(subset=['keyword', 'genre'])
+    return {genre: group['keyword'].astype(str).tolist() for genre, group in rules.groupby('genre', sort=False)}
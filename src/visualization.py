@@ -3,6 +3,10 @@ import seaborn as sns
 import pandas as pd
 import numpy as np
 import matplotlib.colors as mcolors
+import matplotlib.patches as mpatches
+import quantile_sketch
+import pace_grid
+import shot_store
 
 # Set professional style globally
 plt.rcParams['font.family'] = 'sans-serif'
@@ -17,45 +21,128 @@ plt.rcParams['xtick.color'] = '#333333'
 plt.rcParams['ytick.color'] = '#333333'
 plt.rcParams['text.color'] = '#333333'
 
-def plot_barcode_timeline(bourne_df, output_path="plots/the_20s_ceiling_barcode.png"):
+def _cut_times(shots_df, title_col=None):
+    # Cut positions (end of each shot) in seconds, per film when title_col is given
+    sort_cols = [title_col, 'shot_number'] if title_col else ['shot_number']
+    shots_df = shots_df.sort_values(sort_cols)
+    lengths = pd.Series(shot_store.to_seconds(shots_df['shot_length_sec']), index=shots_df.index)
+    if title_col:
+        return shots_df[title_col].to_numpy(), lengths.groupby(shots_df[title_col], observed=True).cumsum().to_numpy()
+    return None, lengths.cumsum().to_numpy()
+
+def _barcode_strip(cut_times, start, end, n_px, line_px):
+    """
+    Rasterizes cuts into one RGBA pixel row: black where a cut falls, transparent
+    elsewhere. Cost is one NumPy pass over the cuts, independent of how many
+    there are once drawn.
+    """
+    cut_times = cut_times[(cut_times >= start) & (cut_times <= end)]
+    cols = np.floor((cut_times - start) / (end - start) * n_px).astype(np.int64)
+    mask = np.zeros(n_px, dtype=bool)
+    for k in range(line_px):
+        mask[np.clip(cols - line_px // 2 + k, 0, n_px - 1)] = True
+    
+    strip = np.zeros((1, n_px, 4))
+    strip[0, :, 3] = mask
+    return strip
+
+def _strip_geometry(ax, dpi, linewidth):
+    # The strip spans the axes, not the figure: size it from the laid-out axes at the save dpi
+    n_px = max(1, int(ax.get_window_extent().width / ax.figure.dpi * dpi))
+    line_px = max(1, int(np.ceil(linewidth / 72 * dpi)))
+    return n_px, line_px
+
+def plot_barcode_timeline(bourne_df, output_path="plots/the_20s_ceiling_barcode.png",
+                          start=0, end=900, title="Visualizing Cut Density: 'The Bourne Ultimatum'", dpi=300):
     """
     Visual 1: The 'Barcode' Timeline
     Horizontal strip where every vertical black line is a cut.
     Refined to look like a literal film strip/barcode.
+    Cuts are rasterized into a single image, so any window (end=None for the whole
+    runtime) renders in about the same time regardless of cut count.
     """
-    bourne_df = bourne_df.sort_values('shot_number')
-    bourne_df['end_time'] = bourne_df['shot_length_sec'].cumsum()
-    
-    # Use first 15 mins for density
-    subset = bourne_df[bourne_df['end_time'] <= 900]
+    _, cut_times = _cut_times(bourne_df)
+    if end is None:
+        end = cut_times.max() if len(cut_times) else 1
     
     plt.figure(figsize=(15, 2)) # Wide and short
     ax = plt.gca()
     
-    # Draw vertical line for each cut
-    for cut_point in subset['end_time']:
-        ax.axvline(x=cut_point, color='black', linewidth=0.6, alpha=1)
-        
     # Remove all standard axes stuff to make it just the barcode
     ax.set_yticks([])
     ax.spines['left'].set_visible(False)
     ax.spines['right'].set_visible(False)
     ax.spines['top'].set_visible(False)
     
-    ax.set_xlim(0, 900)
-    ax.set_xlabel("Time (Seconds) - First 15 Minutes", fontsize=10)
-    ax.set_title("Visualizing Cut Density: 'The Bourne Ultimatum'", fontsize=12, loc='left')
+    ax.set_xlim(start, end)
+    ax.set_ylim(0, 1)
+    if (start, end) == (0, 900):
+        ax.set_xlabel("Time (Seconds) - First 15 Minutes", fontsize=10)
+    else:
+        ax.set_xlabel(f"Time (Seconds) - {start:.0f}s to {end:.0f}s", fontsize=10)
+    ax.set_title(title, fontsize=12, loc='left')
     
     plt.tight_layout()
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    n_px, line_px = _strip_geometry(ax, dpi, 0.6)
+    ax.imshow(_barcode_strip(cut_times, start, end, n_px, line_px), extent=[start, end, 0, 1],
+              aspect='auto', interpolation='nearest', zorder=2)
+    plt.savefig(output_path, dpi=dpi, bbox_inches='tight')
     plt.close()
 
-def plot_cumulative_density(mb_df, output_path="plots/cumulative_density.png"):
-    """Visual 2: The '95% Threshold' CDF"""
-    plt.figure(figsize=(10, 6))
-    sns.ecdfplot(data=mb_df, x="duration", color="#333333", linewidth=2.5, label="All Cinema (MovieBench)")
+def plot_barcode_wall(shots_df, output_path="plots/barcode_wall.png", title_col='movie_title',
+                      start=0, end=None, dpi=300):
+    """
+    Stacked barcodes, one row per film, on a shared time axis.
+    end=None spans the longest runtime. One image artist per film.
+    """
+    titles, cut_times = _cut_times(shots_df, title_col)
+    # Group the cuts by film once: film i owns order[offsets[i]:offsets[i + 1]]
+    codes, films = pd.factorize(titles)
+    rows = np.flatnonzero(codes >= 0)
+    order = rows[np.argsort(codes[rows], kind='stable')]
+    offsets = np.zeros(len(films) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes[rows], minlength=len(films)), out=offsets[1:])
+    if end is None:
+        end = cut_times.max() if len(cut_times) else 1
+    
+    plt.figure(figsize=(15, max(2, 0.5 * len(films))))
+    ax = plt.gca()
+    
+    ax.set_yticks(np.arange(len(films)) + 0.5)
+    ax.set_yticklabels(films, fontsize=9)
+    ax.tick_params(axis='y', length=0)
+    ax.grid(False, axis='y')
+    ax.spines['left'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.spines['top'].set_visible(False)
     
-    p95 = mb_df['duration'].quantile(0.95)
+    ax.set_xlim(start, end)
+    ax.set_ylim(len(films), 0)
+    ax.set_xlabel("Time (Seconds)", fontsize=10)
+    ax.set_title("Cut Density by Film", fontsize=12, loc='left')
+    
+    plt.tight_layout()
+    n_px, line_px = _strip_geometry(ax, dpi, 0.6)
+    for row in range(len(films)):
+        strip = _barcode_strip(cut_times[order[offsets[row]:offsets[row + 1]]], start, end, n_px, line_px)
+        ax.imshow(strip, extent=[start, end, row + 0.9, row + 0.1], aspect='auto', interpolation='nearest', zorder=2)
+    plt.savefig(output_path, dpi=dpi, bbox_inches='tight')
+    plt.close()
+
+def plot_cumulative_density(mb_df, output_path="plots/cumulative_density.png", sketch=None):
+    """
+    Visual 2: The '95% Threshold' CDF
+    With a sketch the curve and threshold are drawn from it instead of the raw shots.
+    """
+    plt.figure(figsize=(10, 6))
+    if sketch is not None:
+        grid = np.linspace(0, 30, 3001)
+        plt.plot(grid, quantile_sketch.sketch_cdf(sketch, grid), color="#333333", linewidth=2.5, label="All Cinema (MovieBench)")
+        p95 = quantile_sketch.sketch_quantile(sketch, 0.95)
+    else:
+        durations = pd.Series(shot_store.to_seconds(mb_df['duration']))
+        sns.ecdfplot(x=durations, color="#333333", linewidth=2.5, label="All Cinema (MovieBench)")
+        p95 = durations.quantile(0.95)
     plt.axvline(x=p95, color='#d62728', linestyle='--', linewidth=2, label=f"95% Threshold ({p95:.1f}s)")
     plt.axhline(y=0.95, color='#d62728', linestyle=':', linewidth=1)
     
@@ -93,23 +180,31 @@ def plot_ceiling_scatter(blockbuster_df, output_path="plots/distribution_histogr
     plt.savefig(output_path, dpi=300)
     plt.close()
 
-def plot_heatmap_of_pace(df, output_path="plots/heatmap_pace.png"):
-    """New Visual 1: Heatmap of Pace"""
-    clean_df = df[(df['start_time_min'] <= 150) & (df['duration'] > 0)].copy()
+def plot_heatmap_of_pace(df, output_path="plots/heatmap_pace.png", grid=None):
+    """
+    New Visual 1: Heatmap of Pace
+    Draws a pre-binned pace_grid directly; without one, df's start_time_min and
+    duration columns are binned first.
+    """
+    if grid is None:
+        durations = shot_store.to_seconds(df['duration'])
+        keep = (df['start_time_min'].to_numpy() <= 150) & (durations > 0)
+        grid = pace_grid.add_points(pace_grid.new_pace_grid(), df['start_time_min'].to_numpy()[keep], durations[keep])
     
     plt.figure(figsize=(12, 7))
     plt.yscale('log')
     
-    h = plt.hist2d(
-        clean_df['start_time_min'], 
-        clean_df['duration'], 
-        bins=[60, 50], 
-        range=[[0, 120], [0.5, 100]], 
+    mesh = plt.pcolormesh(
+        grid['x_edges'], 
+        grid['y_edges'], 
+        grid['counts'].T.astype(np.float64), 
         norm=mcolors.LogNorm(), 
         cmap='inferno'
     )
+    plt.xlim(grid['x_edges'][0], grid['x_edges'][-1])
+    plt.ylim(grid['y_edges'][0], grid['y_edges'][-1])
     
-    plt.colorbar(h[3], label='Shot Density')
+    plt.colorbar(mesh, label='Shot Density')
     plt.xlabel("Movie Runtime (Minutes)", fontsize=11, weight='bold')
     plt.ylabel("Shot Duration (Seconds) - Log Scale", fontsize=11, weight='bold')
     plt.title("The 'Void' of Long Shots: Heatmap of Pace", fontsize=14, loc='left', pad=20)
@@ -119,21 +214,49 @@ def plot_heatmap_of_pace(df, output_path="plots/heatmap_pace.png"):
     plt.savefig(output_path, dpi=300)
     plt.close()
 
-def plot_genre_fingerprint(genre_df, output_path="plots/genre_fingerprint.png"):
-    """New Visual 2: Genre Fingerprint"""
+def _plot_sketch_densities(sketches, palette, alpha, linewidth, cut=3, gridsize=200):
+    # Mirrors sns.kdeplot(hue=..., fill=True, common_norm=False): same support grid,
+    # artists, draw order and legend, with quantile_sketch.sketch_kde as the estimator
+    ax = plt.gca()
+    for genre, sketch in reversed(list(sketches.items())):
+        if sketch['count'] < 2:
+            continue
+        bandwidth = quantile_sketch.kde_bandwidth(sketch)
+        support = np.linspace(sketch['min'] - cut * bandwidth, sketch['max'] + cut * bandwidth, gridsize)
+        artist = ax.fill_between(support, 0, quantile_sketch.sketch_kde(sketch, support, bandwidth),
+                                 facecolor=mcolors.to_rgba(palette[genre], alpha),
+                                 edgecolor=mcolors.to_rgba(palette[genre], 1), linewidth=linewidth)
+        artist.sticky_edges.x[:] = []
+        artist.sticky_edges.y[:] = (0, np.inf)
+    
+    handles = [mpatches.Patch(facecolor=mcolors.to_rgba(palette[genre], alpha),
+                              edgecolor=mcolors.to_rgba(palette[genre], 1), linewidth=linewidth)
+               for genre in sketches]
+    ax.legend(handles, list(sketches), title="genre")
+
+def plot_genre_fingerprint(genre_df, output_path="plots/genre_fingerprint.png", sketches=None):
+    """
+    New Visual 2: Genre Fingerprint
+    With per-genre sketches ({genre: sketch}) the densities are binned, FFT-smoothed
+    KDEs drawn the way sns.kdeplot draws them, so the cost does not grow with the
+    number of shots.
+    """
     plt.figure(figsize=(10, 6))
     palette = {"Action": "#d62728", "Drama": "#1f77b4", "Comedy": "#ff7f0e"}
     
-    sns.kdeplot(
-        data=genre_df, 
-        x="duration", 
-        hue="genre", 
-        fill=True, 
-        common_norm=False, 
-        palette=palette,
-        alpha=0.4,
-        linewidth=2
-    )
+    if sketches is not None:
+        _plot_sketch_densities(sketches, palette, alpha=0.4, linewidth=2)
+    else:
+        sns.kdeplot(
+            data=genre_df.assign(duration=shot_store.to_seconds(genre_df['duration'])), 
+            x="duration", 
+            hue="genre", 
+            fill=True, 
+            common_norm=False, 
+            palette=palette,
+            alpha=0.4,
+            linewidth=2
+        )
     
     plt.xlim(0, 15)
     plt.xlabel("Shot Duration (Seconds)", fontsize=11, weight='bold')